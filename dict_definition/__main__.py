@@ -0,0 +1,69 @@
+#           DO WHAT THE F*** YOU WANT TO PUBLIC LICENSE
+#                   Version 2, December 2004
+#
+# Copyright (C) 2015- ZwodahS(github.com/ZwodahS)
+# zwodahs.github.io
+#
+# Everyone is permitted to copy and distribute verbatim or modified
+# copies of this license document, and changing it is allowed as long
+# as the name is changed.
+#
+#           DO WHAT THE F*** YOU WANT TO PUBLIC LICENSE
+#   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#  0. You just DO WHAT THE F*** YOU WANT TO.
+#
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+python -m dict_definition package.module:Model input.jsonl [-o cleaned.jsonl] [-e errors.jsonl]
+"""
+import argparse
+import sys
+
+from .dd_cleaner import DictValueError
+from .dd_pipeline import load_model, run_pipeline
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m dict_definition",
+                                     description="Clean and validate a JSON Lines file against a DefinedDict.")
+    parser.add_argument("model", help="the model, in the form package.module:ClassName")
+    parser.add_argument("input", help="the JSON Lines file, - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="where the valid records are written, - for stdout (default)")
+    parser.add_argument("-e", "--errors", default=None, help="where the error reports are written, - for stdout")
+    parser.add_argument("--no-clean", action="store_true", help="do not run clean_document")
+    parser.add_argument("--no-validate", action="store_true", help="do not run get_document_errors")
+    parser.add_argument("--no-default", action="store_true", help="do not set the default values when cleaning")
+    parser.add_argument("--keep-undefined", action="store_true", help="do not remove the undefined keys when cleaning")
+    parser.add_argument("--labels", nargs="+", default=None, help="run clean_labels with these labels")
+    parser.add_argument("--exclude", nargs="+", default=None, help="the labels excluded from clean_labels")
+    parser.add_argument("-q", "--quiet", action="store_true", help="do not print the throughput to stderr")
+    args = parser.parse_args(argv)
+
+    try:
+        model = load_model(args.model)
+    except (ImportError, DictValueError) as e:
+        parser.error(str(e))
+    stats = run_pipeline(
+        model,
+        sys.stdin.buffer if args.input == "-" else args.input,
+        cleaned_sink=sys.stdout if args.output == "-" else args.output,
+        errors_sink=sys.stdout if args.errors == "-" else args.errors,
+        clean=not args.no_clean,
+        validate=not args.no_validate,
+        set_default=not args.no_default,
+        remove_undefined=not args.keep_undefined,
+        labels=args.labels,
+        exclude=args.exclude,
+    )
+    if not args.quiet:
+        sys.stderr.write("{0}\n".format(stats))
+    return 0 if stats.invalid == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+#           DO WHAT THE F*** YOU WANT TO PUBLIC LICENSE
+#                   Version 2, December 2004
+#
+# Copyright (C) 2015- ZwodahS(github.com/ZwodahS)
+# zwodahs.github.io
+#
+# Everyone is permitted to copy and distribute verbatim or modified
+# copies of this license document, and changing it is allowed as long
+# as the name is changed.
+#
+#           DO WHAT THE F*** YOU WANT TO PUBLIC LICENSE
+#   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#  0. You just DO WHAT THE F*** YOU WANT TO.
+#
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+Reproducible benchmark suite of the hot paths of dict_definition and dict_utils.
+
+    python -m dict_definition.dd_bench_suite --save baseline.json
+    python -m dict_definition.dd_bench_suite --baseline baseline.json --threshold 0.2
+
+The models and documents are generated from a fixed seed, for each shape : flat, wide, deep, list and map.
+Each operation is timed with time.perf_counter and reports ops/sec and the peak memory allocated during one call.
+The operations that remove values from their document are timed on new copies, the copying is not timed.
+With --baseline, the exit code is 1 if an operation is slower (or uses more memory) than the baseline by more than
+the threshold.
+"""
+import argparse
+import copy
+import functools
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from .dd_cleaner import *
+from dict_utils.dict_utils import compile_filter, compile_projection, dict_flatten
+
+SEED = 1234
+
+#################################### Shapes ####################################
+def _model(name, fields):
+    return DefinedDictMetaClass(name, (DefinedDict, CleanerMixin), dict(fields))
+
+
+def _scalar_fields(count):
+    """count fields, cycling through the field types, every fifth field is labelled private"""
+    fields = {}
+    for i in range(count):
+        kind = i % 4
+        labels = "private" if i % 5 == 0 else "public"
+        if kind == 0:
+            field = StringField(max_length=64, labels=labels)
+        elif kind == 1:
+            field = IntField(min=0, max=1000, default=0, labels=labels)
+        elif kind == 2:
+            field = FloatField(min=0.0, labels=labels)
+        else:
+            field = BoolField(default=False, labels=labels)
+        fields["f{0}".format(i)] = field
+    return fields
+
+
+def _scalar_value(rng, key):
+    kind = int(key.rsplit("f", 1)[1]) % 4
+    if kind == 0:
+        return "value {0}".format(rng.randrange(1000))
+    if kind == 1:
+        return rng.randrange(1000)
+    if kind == 2:
+        return rng.random() * 100
+    return rng.random() < 0.5
+
+
+def _scalar_document(rng, model):
+    return { key : _scalar_value(rng, key) for key in model._fields if key[0] == "f" }
+
+
+def make_flat(rng):
+    model = _model("Flat", _scalar_fields(20))
+    document = _scalar_document(rng, model)
+    return model, document, { "f1" : 1, "f2" : 2.0 }, { "exclude" : ["f0", "f4"] }, [("f1", "moved"), ("moved", "f1")]
+
+
+def make_wide(rng):
+    model = _model("Wide", _scalar_fields(400))
+    document = _scalar_document(rng, model)
+    return model, document, { "f1" : 1, "f399" : True }, { "exclude" : ["f0", "f200"] }, [("f1", "moved"), ("moved", "f1")]
+
+
+def make_deep(rng, depth=12):
+    model = _model("Deep{0}".format(depth), _scalar_fields(4))
+    for level in range(depth - 1, -1, -1):
+        fields = _scalar_fields(4)
+        fields["child"] = DefinedDictField(model=model)
+        model = _model("Deep{0}".format(level), fields)
+    document = current = _scalar_document(rng, model)
+    child_model = model
+    path = []
+    while "child" in child_model._fields:
+        child_model = child_model._fields["child"].model
+        current["child"] = _scalar_document(rng, child_model)
+        current = current["child"]
+        path.append("child")
+    deepest = ".".join(path)
+    update = new_value = {}
+    for _ in range(depth // 2):
+        new_value["child"] = {}
+        new_value = new_value["child"]
+    new_value["f1"] = 1
+    return model, document, update, { "exclude" : [deepest + ".f0"] }, [(deepest + ".f1", "moved"), ("moved", deepest + ".f1")]
+
+
+def make_list(rng, items=200):
+    item_model = _model("ListItem", _scalar_fields(8))
+    model = _model("List", {
+        "name" : StringField(is_required=True),
+        "items" : ListField(inner_type=DefinedDictField(model=item_model)),
+        "tags" : ListField(inner_type=StringField(choices=[ "tag{0}".format(i) for i in range(50) ])),
+    })
+    document = {
+        "name" : "list",
+        "items" : [ _scalar_document(rng, item_model) for _ in range(items) ],
+        "tags" : [ "tag{0}".format(rng.randrange(50)) for _ in range(items) ],
+    }
+    return model, document, { "name" : "renamed" }, { "exclude" : ["items.f0", "items.f4"] }, [("name", "moved"), ("moved", "name")]
+
+
+def make_map(rng, entries=200):
+    entry_model = _model("MapEntry", _scalar_fields(8))
+    model = _model("Map", {
+        "name" : StringField(is_required=True),
+        "counters" : MapField(inner_type=IntField(min=0)),
+        "entries" : MapField(inner_type=DefinedDictField(model=entry_model)),
+    })
+    document = {
+        "name" : "map",
+        "counters" : { "c{0}".format(i) : rng.randrange(1000) for i in range(entries) },
+        "entries" : { "e{0}".format(i) : _scalar_document(rng, entry_model) for i in range(entries // 4) },
+    }
+    return model, document, { "counters" : { "c0" : 1 } }, { "exclude" : ["entries.e0", "counters.c1"] }, \
+        [("counters.c0", "moved"), ("moved", "counters.c0")]
+
+
+SHAPES = (("flat", make_flat), ("wide", make_wide), ("deep", make_deep), ("list", make_list), ("map", make_map))
+
+#################################### Operations ####################################
+def _operations(model, document, update, filter_spec, projection):
+    """Returns [ (name, func, make_input) ], func is called with the result of make_input.
+
+    clean_document and clean_labels are given a new copy of the document for each call, so that they have something
+    to remove every time. The copies are made by make_input, outside of the timings.
+    The other functions reach a steady state after the first call, they share a single copy made once.
+    """
+    dirty = dict(copy.deepcopy(document), undefined_key=1)
+    updated = copy.deepcopy(document)
+    projected = copy.deepcopy(document)
+    dict_filter = compile_filter(**filter_spec).apply
+    dict_project = compile_projection(projection).apply
+    shared = lambda value: lambda: value
+    fresh = lambda value: functools.partial(copy.deepcopy, value)
+    return [
+        ("get_document_errors", model.get_document_errors, shared(document)),
+        ("is_document_valid", model.is_document_valid, shared(document)),
+        ("clean_document", model.clean_document, fresh(dirty)),
+        ("make_default", lambda _: model.make_default(), shared(None)),
+        ("update", lambda value: model.update(value, update), shared(updated)),
+        ("clean_labels", lambda value: model.clean_labels(value, "private", exclude="public"), fresh(document)),
+        ("dict_filter", dict_filter, shared(document)),
+        ("dict_project", dict_project, shared(projected)),
+        ("dict_flatten", dict_flatten, shared(document)),
+    ]
+
+
+_CHUNK = 64
+
+
+def _timeit(func, make_input, number):
+    """Returns the seconds taken by number calls of func, the inputs are made in chunks outside of the timing"""
+    seconds = 0.0
+    while number > 0:
+        inputs = [ make_input() for _ in range(min(number, _CHUNK)) ]
+        number -= len(inputs)
+        start = time.perf_counter()
+        for value in inputs:
+            func(value)
+        seconds += time.perf_counter() - start
+    return seconds
+
+
+def _peak_memory(func, make_input):
+    value = make_input()
+    tracemalloc.start()
+    try:
+        func(value)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_suite(shapes=None, operations=None, repeat=5, min_time=0.2):
+    """Run the benchmarks, returns { "shape/operation" : { "ops_per_sec" : x, "peak_bytes" : y } }
+
+    shapes, operations      the names to run, all of them if None
+    repeat                  the number of timings of each operation, the best one is kept
+    min_time                the min time of a timing, the number of calls is scaled up to reach it
+    """
+    results = {}
+    for shape, make in SHAPES:
+        if shapes is not None and shape not in shapes:
+            continue
+        for name, func, make_input in _operations(*make(random.Random(SEED))):
+            if operations is not None and name not in operations:
+                continue
+            func(make_input()) # warm up, and the functions that share their input reach their steady state
+            number = 1
+            while _timeit(func, make_input, number) < min_time:
+                number *= 2
+            seconds = min(_timeit(func, make_input, number) for _ in range(repeat)) / number
+            results["{0}/{1}".format(shape, name)] = {
+                "ops_per_sec" : 1 / seconds, "peak_bytes" : _peak_memory(func, make_input),
+            }
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Returns [ (name, metric, baseline value, value) ] of the results that regressed by more than threshold"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+            regressions.append((name, "ops_per_sec", base["ops_per_sec"], result["ops_per_sec"]))
+        if result["peak_bytes"] > base["peak_bytes"] * (1 + threshold):
+            regressions.append((name, "peak_bytes", base["peak_bytes"], result["peak_bytes"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m dict_definition.dd_bench_suite",
+                                     description="Benchmark the hot paths of dict_definition and dict_utils.")
+    parser.add_argument("--shapes", nargs="+", choices=[ s for s, _ in SHAPES ], default=None, help="the shapes to run")
+    parser.add_argument("--operations", nargs="+", default=None, help="the operations to run")
+    parser.add_argument("--repeat", type=int, default=5, help="the number of timings of each operation (default : 5)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="the min seconds of a timing (default : 0.2)")
+    parser.add_argument("--save", default=None, help="save the results as a baseline JSON file")
+    parser.add_argument("--baseline", default=None, help="compare the results with a baseline JSON file")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="the relative slowdown or memory increase reported as a regression (default : 0.1)")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    results = run_suite(shapes=args.shapes, operations=args.operations, repeat=args.repeat, min_time=args.min_time)
+    for name, result in results.items():
+        line = "{0:<32} {1:>14.1f} ops/sec {2:>12} bytes".format(name, result["ops_per_sec"], result["peak_bytes"])
+        if baseline is not None and name in baseline:
+            line += " {0:>8.2f}x".format(result["ops_per_sec"] / baseline[name]["ops_per_sec"])
+        print(line)
+
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump({ "python" : platform.python_version(), "seed" : SEED, "results" : results }, f, indent=2, sort_keys=True)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for name, metric, base, value in regressions:
+            print("REGRESSION {0} {1} : {2:.1f} -> {3:.1f}".format(name, metric, base, value))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,556 @@
+#           DO WHAT THE F*** YOU WANT TO PUBLIC LICENSE
+#                   Version 2, December 2004
+#
+# Copyright (C) 2015- ZwodahS(github.com/ZwodahS)
+# zwodahs.github.io
+#
+# Everyone is permitted to copy and distribute verbatim or modified
+# copies of this license document, and changing it is allowed as long
+# as the name is changed.
+#
+#           DO WHAT THE F*** YOU WANT TO PUBLIC LICENSE
+#   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#  0. You just DO WHAT THE F*** YOU WANT TO.
+#
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+Ad-hoc benchmarks for dict_definition.
+
+Run with : python -m dict_definition.dd_benchmark
+"""
+import asyncio
+import concurrent.futures
+import copy
+import json
+import os
+import sys
+import time
+import timeit
+import tracemalloc
+
+from dict_utils.dict_utils import compile_filter
+from .dd_cleaner import *
+from .dd_parallel import *
+from . import dd_columnar
+from .dd_cache import ValidationCache
+from .dd_profile import Profiler
+
+#################################### Models ####################################
+class BenchAddress(DefinedDict, CleanerMixin):
+    street = StringField(is_required=True)
+    number = IntField(min=0, choices=list(range(100)))
+    postcode = StringField(labels="private")
+    tags = ListField(inner_type=StringField(choices=["home", "work", "other"]))
+
+
+class BenchUser(DefinedDict, CleanerMixin):
+    name = StringField(is_required=True)
+    email = StringField(labels="private")
+    age = IntField(min=0, max=150, choices=list(range(150)))
+    score = FloatField(default=0.0)
+    active = BoolField(default=True)
+    role = StringField(choices=["admin", "user", "guest"], default="user")
+    address = DefinedDictField(model=BenchAddress)
+    addresses = ListField(inner_type=DefinedDictField(model=BenchAddress))
+    counters = MapField(inner_type=IntField())
+    notes = ListField(inner_type=StringField())
+
+
+class BenchProfile(DefinedDict):
+    name = StringField(is_required=True)
+    email = StringField()
+    age = IntField(min=0, max=150, choices=list(range(150)))
+    score = FloatField(default=0.0)
+    active = BoolField(default=True)
+    role = StringField(choices=["admin", "user", "guest"], default="user")
+
+
+class BenchMetrics(DefinedDict):
+    user_id = IntField(is_required=True)
+    views = IntField(min=0, choices=range(1000))
+    clicks = IntField(min=0, choices=range(1000))
+    ratio = FloatField(min=0.0, max=1.0, choices=[i / 100 for i in range(100)])
+    active = BoolField(is_required=True)
+
+
+class BenchLeaf(DefinedDict):
+    key = StringField(is_required=True)
+    value = FloatField(min=0.0)
+    flags = ListField(inner_type=BoolField())
+
+
+class BenchBranch(DefinedDict):
+    name = StringField(is_required=True)
+    leaves = ListField(inner_type=DefinedDictField(model=BenchLeaf))
+
+
+class BenchTree(DefinedDict):
+    name = StringField(is_required=True)
+    branches = ListField(inner_type=DefinedDictField(model=BenchBranch))
+
+
+class BenchDefaultLeaf(DefinedDict):
+    name = StringField(default="leaf")
+    count = IntField(default=0)
+    ratio = FloatField(default=1.0)
+    tags = ListField(default=["a", "b"])
+    created = Field(default=lambda field: 0)
+    note = StringField()
+
+
+class BenchDefaultLevel2(DefinedDict):
+    name = StringField(default="level2")
+    left = DefinedDictField(model=BenchDefaultLeaf)
+    right = DefinedDictField(model=BenchDefaultLeaf)
+    active = BoolField(default=True)
+
+
+class BenchDefaultLevel1(DefinedDict):
+    name = StringField(default="level1")
+    left = DefinedDictField(model=BenchDefaultLevel2)
+    right = DefinedDictField(model=BenchDefaultLevel2)
+    items = ListField()
+
+
+class BenchDefaultRoot(DefinedDict):
+    name = StringField(default="root")
+    left = DefinedDictField(model=BenchDefaultLevel1)
+    right = DefinedDictField(model=BenchDefaultLevel1)
+    settings = DictField(default={ "theme" : "dark" })
+
+
+def make_address(i):
+    return { "street" : "street %d" % i, "number" : i % 100, "postcode" : "%06d" % i, "tags" : ["home", "work"] }
+
+
+def make_user(i, addresses=5):
+    return {
+        "name" : "user %d" % i,
+        "email" : "user%d@example.com" % i,
+        "age" : i % 150,
+        "score" : float(i),
+        "active" : bool(i % 2),
+        "role" : "user",
+        "address" : make_address(i),
+        "addresses" : [ make_address(i + j) for j in range(addresses) ],
+        "counters" : { "c%d" % j : j for j in range(5) },
+        "notes" : [ "note %d" % j for j in range(5) ],
+    }
+
+
+def make_tree(branches=50, leaves=50):
+    return {
+        "name" : "tree",
+        "branches" : [
+            {
+                "name" : "branch %d" % i,
+                "leaves" : [ { "key" : "leaf %d" % j, "value" : float(j), "flags" : [True, False] } for j in range(leaves) ],
+            } for i in range(branches)
+        ],
+    }
+
+#################################### Benchmarks ####################################
+def _report(name, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=3))
+    print("{0:<50} {1:>12.1f} ops/sec".format(name, number / seconds))
+    return seconds
+
+
+def bench_compiled_errors(number=2000):
+    valid = make_user(1)
+    invalid = make_user(2)
+    invalid.update({ "name" : None, "age" : -1, "role" : "root" })
+    invalid["addresses"][0]["tags"] = ["nowhere", 1]
+    for document in (valid, invalid):
+        assert list(BenchUser._yield_errors(document)) == BenchUser.get_document_errors(document)
+
+    print("== get_document_errors : generators vs compiled plan ==")
+    for label, document in (("valid", valid), ("invalid", invalid)):
+        generator = _report("generators ({0})".format(label), lambda: list(BenchUser._yield_errors(document)), number)
+        compiled = _report("compiled plan ({0})".format(label), lambda: BenchUser.get_document_errors(document), number)
+        print("{0:<50} {1:>12.2f}x".format("speedup ({0})".format(label), generator / compiled))
+
+
+def _generator_is_valid(model, document):
+    try:
+        next(model._yield_errors(document))
+        return False
+    except StopIteration:
+        return True
+
+
+def bench_is_document_valid(number=20):
+    valid = make_tree()
+    invalid = make_tree()
+    invalid["branches"][-1]["leaves"][-1]["key"] = None
+    for document in (valid, invalid):
+        assert _generator_is_valid(BenchTree, document) == BenchTree.is_document_valid(document)
+
+    print("== is_document_valid : generators vs fail fast plan (50 x 50 nested leaves) ==")
+    for label, document in (("valid", valid), ("invalid, last leaf", invalid)):
+        generator = _report("generators ({0})".format(label), lambda: _generator_is_valid(BenchTree, document), number)
+        fail_fast = _report("fail fast plan ({0})".format(label), lambda: BenchTree.is_document_valid(document), number)
+        print("{0:<50} {1:>12.2f}x".format("speedup ({0})".format(label), generator / fail_fast))
+
+
+
+def bench_validate_many(number=5, documents=2000):
+    batch = [ make_user(i, addresses=2) for i in range(documents) ]
+    assert [ errors for _, errors in BenchUser.validate_many(batch) ] == [ BenchUser.get_document_errors(d) for d in batch ]
+
+    print("== validate_many : {0} documents per op ==".format(documents))
+    one_by_one = _report("get_document_errors loop", lambda: [ BenchUser.get_document_errors(d) for d in batch ], number)
+    many = _report("validate_many", lambda: list(BenchUser.validate_many(batch)), number)
+    print("{0:<50} {1:>12.2f}x".format("speedup", one_by_one / many))
+
+
+
+def bench_parallel(documents=20000, chunk_size=500):
+    batch = [ make_user(i, addresses=2) for i in range(documents) ]
+    print("== ParallelRunner.validate : {0} documents, chunk_size {1} ==".format(documents, chunk_size))
+    start = time.perf_counter()
+    for _ in BenchUser.validate_many(batch):
+        pass
+    serial = time.perf_counter() - start
+    print("{0:<50} {1:>12.1f} docs/sec".format("validate_many (serial)", documents / serial))
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        with ParallelRunner(BenchUser, workers=workers, chunk_size=chunk_size) as runner:
+            list(runner.validate(batch[:chunk_size * workers])) # warm up the workers
+            start = time.perf_counter()
+            for _ in runner.validate(batch):
+                pass
+            elapsed = time.perf_counter() - start
+        print("{0:<50} {1:>12.1f} docs/sec {2:>8.2f}x".format("{0} workers".format(workers), documents / elapsed, serial / elapsed))
+        workers *= 2
+
+
+
+def bench_revalidate(number=200):
+    document = make_user(1, addresses=500)
+    errors = BenchUser.get_document_errors(document)
+    delta = BenchUser.update(document, { "address" : { "number" : 500 }, "age" : 20 }, with_delta=True)
+    assert sorted(map(repr, BenchUser.revalidate_document(document, errors, delta))) == \
+        sorted(map(repr, BenchUser.get_document_errors(document)))
+    # values that only change type inside a list or a map must be re-checked as well
+    for model, before, new_value in [
+        (BenchLeaf, { "key" : "leaf", "flags" : [True, 1] }, { "flags" : [True, True] }),
+        (BenchLeaf, { "key" : "leaf", "flags" : [True, True] }, { "flags" : [True, 1] }),
+        (BenchUser, make_user(2), { "counters" : { "c1" : 1.0 }, "address" : { "number" : 5.0 } }),
+    ]:
+        before_errors = model.get_document_errors(before)
+        changed = model.update(before, new_value, with_delta=True)
+        assert sorted(map(repr, model.revalidate_document(before, before_errors, changed))) == \
+            sorted(map(repr, model.get_document_errors(before)))
+
+    print("== revalidate_document : 2 fields changed in a document with 500 addresses ==")
+    full = _report("get_document_errors", lambda: BenchUser.get_document_errors(document), number)
+    incremental = _report("revalidate_document", lambda: BenchUser.revalidate_document(document, errors, delta), number)
+    print("{0:<50} {1:>12.2f}x".format("speedup", full / incremental))
+
+
+
+def _traced(func):
+    tracemalloc.start()
+    try:
+        result = func()
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_record_memory(documents=100000):
+    keys = tuple(BenchProfile._fields.keys())
+    values = [ ("user %d" % i, "user%d@example.com" % i, i % 150, float(i), bool(i % 2), "user") for i in range(documents) ]
+    record_class = BenchProfile.record_class()
+
+    dicts, dict_memory = _traced(lambda: [ dict(zip(keys, v)) for v in values ])
+    records, record_memory = _traced(lambda: [ record_class.from_dict(d) for d in dicts ])
+    assert records[0].to_dict() == dicts[0] and records[0].get_errors() == BenchProfile.get_document_errors(dicts[0])
+
+    print("== Record : memory of {0} documents with {1} fields (values excluded) ==".format(documents, len(keys)))
+    print("{0:<50} {1:>12.1f} bytes/doc".format("dict", dict_memory / documents))
+    print("{0:<50} {1:>12.1f} bytes/doc".format("record", record_memory / documents))
+    print("{0:<50} {1:>12.2f}x".format("saving", dict_memory / record_memory))
+
+
+
+def bench_columnar(number=3, documents=100000):
+    batch = [
+        { "user_id" : i, "views" : i % 1200, "clicks" : i % 7, "ratio" : (i % 100) / 100, "active" : bool(i % 3) }
+        for i in range(documents)
+    ]
+    scalar = [ BenchMetrics.get_document_errors(d) for d in batch ]
+    print("== ColumnarBatch : {0} numeric documents (numpy : {1}) ==".format(documents, dd_columnar.numpy is not None))
+    scalar_time = _report("get_document_errors loop", lambda: [ BenchMetrics.get_document_errors(d) for d in batch ], number)
+    for use_numpy in ((False, True) if dd_columnar.numpy is not None else (False, )):
+        columnar = dd_columnar.ColumnarBatch(BenchMetrics, batch, use_numpy=use_numpy)
+        assert columnar.get_errors() == scalar and columnar.to_documents() == batch
+        label = "numpy" if use_numpy else "array"
+        _report("ColumnarBatch build ({0})".format(label), lambda: dd_columnar.ColumnarBatch(BenchMetrics, batch, use_numpy=use_numpy), number)
+        columnar_time = _report("ColumnarBatch.get_errors ({0})".format(label), columnar.get_errors, number)
+        print("{0:<50} {1:>12.2f}x".format("speedup ({0})".format(label), scalar_time / columnar_time))
+
+
+
+def _generic_make_default(model):
+    """make_default as it was before the factories, a dict comprehension calling Field.make_default"""
+    return {
+        key : _generic_make_default(definition.model) if isinstance(definition, DefinedDictField) and definition.default is None
+        else definition.make_default()
+        for key, definition in model._fields.items()
+    }
+
+
+def bench_make_default(number=20000):
+    assert _generic_make_default(BenchDefaultRoot) == BenchDefaultRoot.make_default()
+    print("== make_default : 4 levels of nested models ==")
+    generic = _report("dict comprehension", lambda: _generic_make_default(BenchDefaultRoot), number)
+    factory = _report("default factory", BenchDefaultRoot.make_default, number)
+    print("{0:<50} {1:>12.2f}x".format("speedup", generic / factory))
+
+
+def _generic_clean_labels(model, document, labels, exclude=None):
+    """clean_labels as it was before the removal plans, checking every field on each call"""
+    labels = set((labels, ) if isinstance(labels, str) else labels)
+    exclude = set((exclude, ) if isinstance(exclude, str) else exclude or ())
+    for key, definition in model._fields.items():
+        if key in document and hasattr(definition, "labels"):
+            field_labels = set((definition.labels, ) if isinstance(definition.labels, str) else definition.labels)
+            if len(labels & field_labels) > 0 and len(field_labels & exclude) == 0:
+                document.pop(key)
+        if isinstance(definition, DefinedDictField) and document.get(key) is not None and CleanerMixin in definition.model._mixins:
+            _generic_clean_labels(definition.model, document.get(key), labels, exclude=exclude)
+
+
+def _report_fresh(name, func, make_input, number):
+    """Same as _report, but func(value) is timed on a new make_input() each time, made before the timing"""
+    best = None
+    for _ in range(3):
+        inputs = [ make_input() for _ in range(number) ]
+        start = time.perf_counter()
+        for value in inputs:
+            func(value)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    print("{0:<50} {1:>12.1f} ops/sec".format(name, number / best))
+    return best
+
+
+def bench_clean_labels(number=500, users=20):
+    response = [ make_user(i, addresses=1) for i in range(users) ]
+    print("== clean_labels : a response of {0} users ==".format(users))
+    def generic(documents):
+        for user in documents:
+            _generic_clean_labels(BenchUser, user, ["private", "internal"])
+    def compiled(documents):
+        for user in documents:
+            BenchUser.clean_labels(user, ["private", "internal"])
+    expected, cleaned = copy.deepcopy(response), copy.deepcopy(response)
+    generic(expected)
+    compiled(cleaned)
+    assert cleaned == expected
+    # the keys are removed from a fresh copy of the response on each run
+    make_response = lambda: copy.deepcopy(response)
+    generic_seconds = _report_fresh("field loop", generic, make_response, number)
+    compiled_seconds = _report_fresh("cached removal plan", compiled, make_response, number)
+    print("{0:<50} {1:>12.2f}x".format("speedup", generic_seconds / compiled_seconds))
+
+
+class BenchTags(DefinedDict):
+    tags = ListField(inner_type=StringField(regex=r"[a-z]+-[0-9]+", min_length=3, max_length=32,
+                                            charset="abcdefghijklmnopqrstuvwxyz-0123456789"))
+
+
+def bench_string_field(number=5, strings=200000):
+    document = { "tags" : [ "tag-%d" % i for i in range(strings) ] }
+    field = BenchTags.tags.inner_type
+    check = field.compile_errors()
+    def element():
+        out = []
+        for ind, value in enumerate(document["tags"]):
+            check(value, "tags." + str(ind), out)
+    print("== StringField regex/length/charset : seconds per million strings ==")
+    for name, func in (("element by element", element), ("batched list path", lambda: BenchTags.get_document_errors(document)),
+                       ("batched list path, is_document_valid", lambda: BenchTags.is_document_valid(document))):
+        seconds = min(timeit.repeat(func, number=number, repeat=3)) / number
+        print("{0:<50} {1:>12.3f} s".format(name, seconds * 1000000 / strings))
+
+
+COUNTRIES = [ "C%02d" % i for i in range(100) ]
+
+
+class BenchVisit(DefinedDict):
+    country = StringField(choices=COUNTRIES)
+    countries = ListField(inner_type=Field(choices=COUNTRIES))
+    status = IntField(choices={ "new" : 0, "open" : 1, "closed" : 2 })
+
+
+def bench_choices(number=200, values=1000):
+    document = { "country" : "C99", "countries" : [ COUNTRIES[-1 - i % 10] for i in range(values) ], "status" : "open" }
+    print("== choices : ListField of {0} values, {1} choices ==".format(values, len(COUNTRIES)))
+    def linear():
+        out = []
+        for ind, value in enumerate(document["countries"]):
+            if value not in COUNTRIES:
+                out.append(("countries." + str(ind), Field.ERROR_VALUE, value))
+    linear_seconds = _report("linear scan of the list", linear, number)
+    hashed_seconds = _report("frozenset lookup", lambda: BenchVisit.get_document_errors(document), number)
+    print("{0:<50} {1:>12.2f}x".format("speedup", linear_seconds / hashed_seconds))
+    documents = [ document ] * 100
+    _report("encode_many, 100 documents", lambda: BenchVisit.encode_many(documents), 20)
+    encoded = BenchVisit.encode_many(documents)
+    assert BenchVisit.decode_many(encoded) == documents
+    print("{0:<50} {1:>12} bytes".format("json size, values", len(json.dumps(documents))))
+    print("{0:<50} {1:>12} bytes".format("json size, codes", len(json.dumps(encoded))))
+
+
+async def _max_loop_lag(work, interval=0.001):
+    """Run work while a ticker sleeps interval in a loop, returns (seconds taken by work, max lag of the ticker)"""
+    lags = []
+    done = asyncio.Event()
+    async def ticker():
+        while not done.is_set():
+            before = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append(time.perf_counter() - before - interval)
+    task = asyncio.ensure_future(ticker())
+    await asyncio.sleep(interval * 2)
+    start = time.perf_counter()
+    await work()
+    seconds = time.perf_counter() - start
+    done.set()
+    await task
+    return seconds, max(lags)
+
+
+def bench_async(addresses=20000):
+    document = make_user(0, addresses=addresses)
+    size = len(json.dumps(document)) / (1024 * 1024)
+    print("== event loop lag : get_document_errors of a {0:.1f} MB document ==".format(size))
+    async def blocking():
+        BenchUser.get_document_errors(document)
+    runs = [
+        ("blocking", blocking),
+        ("cooperative, yield_every=1000", lambda: BenchUser.aget_document_errors(document)),
+        ("cooperative, yield_every=100", lambda: BenchUser.aget_document_errors(document, yield_every=100)),
+        ("executor", lambda: BenchUser.aget_document_errors(document, mode=ASYNC_EXECUTOR)),
+    ]
+    for name, work in runs:
+        seconds, lag = asyncio.run(_max_loop_lag(work))
+        print("{0:<50} {1:>8.1f} ms total {2:>8.2f} ms max lag".format(name, seconds * 1000, lag * 1000))
+
+
+def bench_profiler(number=2000):
+    document = make_user(1)
+    print("== Profiler : get_document_errors ==")
+    before = _report("never enabled", lambda: BenchUser.get_document_errors(document), number)
+    with Profiler() as profiler:
+        enabled = _report("enabled", lambda: BenchUser.get_document_errors(document), number)
+    after = _report("disabled", lambda: BenchUser.get_document_errors(document), number)
+    print("{0:<50} {1:>12.2f}x".format("overhead (enabled)", enabled / before))
+    print("{0:<50} {1:>12.2f}x".format("overhead (disabled)", after / before))
+    for model, key, counters in profiler.top(3):
+        print("{0:<50} {1:>12.1f} us/call".format(model.split(":")[-1] + "." + key, counters["seconds"] * 1000000 / counters["calls"]))
+
+
+def bench_clean_copy(number=2000):
+    clean = make_user(1)
+    BenchUser.clean_document(clean)
+    dirty = dict(clean, extra=1, notes=["a", None])
+    for document in (clean, dirty):
+        assert BenchUser.clean_document(document, in_place=False) == BenchUser.clean_document(copy.deepcopy(document))
+    print("== clean_document : deepcopy + in place vs in_place=False ==")
+    for label, document in (("already clean", clean), ("2 changes", dirty)):
+        deepcopy = _report("deepcopy ({0})".format(label), lambda: BenchUser.clean_document(copy.deepcopy(document)), number)
+        cow = _report("in_place=False ({0})".format(label), lambda: BenchUser.clean_document(document, in_place=False), number)
+        print("{0:<50} {1:>12.2f}x".format("speedup ({0})".format(label), deepcopy / cow))
+
+
+def bench_validation_cache(number=2000):
+    document = make_user(1, addresses=20)
+    cache = ValidationCache(BenchUser)
+    assert cache.get_document_errors(document) == BenchUser.get_document_errors(document)
+    # a sub-document changed with the update of its own model drops the cached versions of the document
+    versioned = make_user(2, addresses=2)
+    assert cache.get_document_errors(versioned, version=2) == []
+    BenchAddress.update(versioned["addresses"][1], { "number" : 500 })
+    assert cache.get_document_errors(versioned, version=2) == BenchUser.get_document_errors(versioned) != []
+    print("== ValidationCache : the same document with 20 addresses ==")
+    plain = _report("get_document_errors", lambda: BenchUser.get_document_errors(document), number)
+    by_fingerprint = _report("cache hit, fingerprint", lambda: cache.get_document_errors(document), number)
+    by_version = _report("cache hit, version", lambda: cache.get_document_errors(document, version=1), number)
+    print("{0:<50} {1:>12.2f}x".format("speedup (fingerprint)", plain / by_fingerprint))
+    print("{0:<50} {1:>12.2f}x".format("speedup (version)", plain / by_version))
+
+
+def _metadata(models):
+    """A snapshot of the shared metadata of models, to check that it is not modified"""
+    return [
+        (model, model._fields, tuple(model._fields.items()), model._mixins, model._error_plan, model._valid_plan,
+         tuple((key, getattr(definition, "labels", None)) for key, definition in model._fields.items()))
+        for model in models
+    ]
+
+
+def _thread_work(documents, count):
+    """Validate, clean and filter count documents, returns the results"""
+    labels_filter = compile_filter(exclude=["email", "address.postcode"])
+    results = []
+    for ind in range(count):
+        document = documents[ind % len(documents)]
+        cleaned = BenchUser.clean_document(document, in_place=False)
+        private = copy.deepcopy(cleaned)
+        BenchUser.clean_labels(private, "private")
+        results.append((BenchUser.get_document_errors(document), BenchUser.is_document_valid(document),
+                        cleaned, private, labels_filter(document)))
+    return results
+
+
+def bench_threads(documents=50, count=200):
+    """Stress test of concurrent use of the models, and throughput by the number of threads"""
+    shared = [ make_user(i, addresses=2) for i in range(documents) ]
+    shared[0]["notes"].append(None)
+    shared[1]["extra"] = 1
+    originals = copy.deepcopy(shared)
+    models = (BenchUser, BenchAddress)
+    metadata = _metadata(models)
+    expected = _thread_work(shared, count)
+
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print("== threads : validate, clean and filter {0} documents per thread (GIL enabled : {1}) ==".format(count, gil))
+    single = None
+    for threads in (1, 2, 4, 8, 16, 64):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+            start = time.perf_counter()
+            results = list(executor.map(lambda _: _thread_work(shared, count), range(threads)))
+            seconds = time.perf_counter() - start
+        assert all(r == expected for r in results)
+        assert shared == originals and _metadata(models) == metadata
+        single = single or count / seconds
+        print("{0:<50} {1:>12.1f} docs/sec {2:>8.2f}x".format("{0} threads".format(threads), count * threads / seconds,
+                                                                count * threads / seconds / single))
+
+
+if __name__ == "__main__":
+    bench_compiled_errors()
+    bench_is_document_valid()
+    bench_validate_many()
+    bench_parallel()
+    bench_revalidate()
+    bench_record_memory()
+    bench_columnar()
+    bench_make_default()
+    bench_clean_labels()
+    bench_string_field()
+    bench_choices()
+    bench_async()
+    bench_profiler()
+    bench_clean_copy()
+    bench_validation_cache()
+    bench_threads()
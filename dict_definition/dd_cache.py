@@ -0,0 +1,284 @@
+#           DO WHAT THE F*** YOU WANT TO PUBLIC LICENSE
+#                   Version 2, December 2004
+#
+# Copyright (C) 2015- ZwodahS(github.com/ZwodahS)
+# zwodahs.github.io
+#
+# Everyone is permitted to copy and distribute verbatim or modified
+# copies of this license document, and changing it is allowed as long
+# as the name is changed.
+#
+#           DO WHAT THE F*** YOU WANT TO PUBLIC LICENSE
+#   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#  0. You just DO WHAT THE F*** YOU WANT TO.
+#
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+Opt-in cache of the validation results of a model, for documents that are validated again and again unchanged.
+
+    cache = ValidationCache(Catalogue, maxsize=1024, ttl=60)
+    errors = cache.get_document_errors(document)
+    errors = cache.get_document_errors(document, version=(document["_id"], document["revision"]))
+"""
+import collections
+import datetime
+import marshal
+import threading
+import time
+
+from .defined_dict import *
+
+_IMMUTABLE_SCALARS = frozenset((type(None), bool, int, float, complex, str, bytes,
+                                datetime.datetime, datetime.date, datetime.time))
+
+
+class _Uncacheable(Exception):
+    """Raised by fingerprint on a value that could change without the document changing"""
+
+
+def fingerprint(value):
+    """Returns a hashable copy of value, that is equal for 2 values only if they validate the same.
+
+    The types are kept, as 1, 1.0 and True are equal but do not validate the same.
+    Raises _Uncacheable if value contains something other than dict, list, tuple, set and immutable scalars.
+    """
+    t = type(value)
+    if t is str:
+        return value
+    if t is dict:
+        return (dict, tuple((k, fingerprint(v)) for k, v in value.items()))
+    if t is list or t is tuple:
+        return (t, tuple(fingerprint(v) for v in value))
+    if t is set or t is frozenset:
+        return (t, frozenset(fingerprint(v) for v in value))
+    if t in _IMMUTABLE_SCALARS:
+        return (t, value)
+    raise _Uncacheable()
+
+
+def _document_key(document):
+    """Returns the fingerprint key of document, or None if it cannot be cached.
+
+    The key is the marshal dump of document, which runs in C and keeps the types of the values.
+    Documents that marshal does not support (i.e. datetime values) fall back to fingerprint.
+    """
+    try:
+        return ("marshal", marshal.dumps(document, 2))
+    except ValueError:
+        pass
+    try:
+        return ("fingerprint", fingerprint(document))
+    except (_Uncacheable, RecursionError):
+        return None
+
+
+def _models_under(model):
+    """Returns model and all the models of its DefinedDictField, including those inside ListField and MapField"""
+    models = []
+    stack = [model]
+    while stack:
+        current = stack.pop()
+        if current in models:
+            continue
+        models.append(current)
+        fields = list(current._fields.values())
+        while fields:
+            definition = fields.pop()
+            if isinstance(definition, DefinedDictField):
+                stack.append(definition.model)
+            elif isinstance(getattr(definition, "inner_type", None), Field):
+                fields.append(definition.inner_type)
+    return models
+
+
+def _dict_ids(document):
+    """Returns the ids of document and all the dictionaries inside it"""
+    ids = []
+    stack = [document]
+    while stack:
+        value = stack.pop()
+        if type(value) is dict:
+            ids.append(id(value))
+            stack.extend(value.values())
+        elif type(value) is list:
+            stack.extend(value)
+    return tuple(ids)
+
+
+class ValidationCache(object):
+    """A bounded LRU cache of get_document_errors of a model.
+
+    model                   The DefinedDict
+    maxsize                 The max number of results kept, the least recently used are evicted first.
+    ttl                     If not None, the seconds a result is kept.
+
+    By default, the results are keyed by the marshal dump of the document, which is a few times cheaper than
+    validating it, so a document changed in any way is validated again. A version can be given instead, any hashable
+    that changes when the document changes, i.e. (_id, revision). The results of a version are dropped when the
+    document or one of its sub-documents is changed with update, of the model or of the model of the sub-document.
+    Documents containing values other than dict, list, tuple, set and immutable scalars are never cached.
+
+    The cache can be used from many threads. The errors returned are a new list each time.
+    """
+
+    def __init__(self, model, maxsize=1024, ttl=None):
+        if not isinstance(model, type) or not issubclass(model, DefinedDict):
+            raise DictValueError(message="Model for ValidationCache needs to be a DefinedDict")
+        if maxsize < 1:
+            raise DictValueError(message="Invalid value for maxsize : {0}".format(maxsize))
+        self.model = model
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = collections.OrderedDict() # key : (errors, expires, ids of the dictionaries of the document)
+        self._versions = {} # id of a dictionary : set of version keys
+        # id of a dictionary being validated : [number of validations running, generation]
+        # The generation is increased by document_updated, a result is only stored if it did not change.
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.uncacheable = 0
+        # the sub-documents can be changed with update of their own model, so all of them notify this cache.
+        for m in _models_under(model):
+            m._validation_caches.add(self)
+
+    def _key(self, document, version):
+        if version is not None:
+            return ("version", version)
+        return _document_key(document)
+
+    def get_document_errors(self, document, version=None):
+        """Same as get_document_errors of the model, the result is cached"""
+        key = self._key(document, version)
+        if key is None:
+            with self._lock:
+                self.uncacheable += 1
+            return self.model.get_document_errors(document)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] is not None and entry[1] <= time.monotonic():
+                    self._remove(key)
+                    self.expirations += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return list(entry[0])
+            self.misses += 1
+            document_ids = _dict_ids(document)
+            generations = self._start_validation(document_ids)
+
+        try:
+            # a document updated between the key and _start_validation no longer matches its key.
+            stale = version is None and _document_key(document) != key
+            errors = self.model.get_document_errors(document)
+        except BaseException:
+            with self._lock:
+                self._end_validation(document_ids)
+            raise
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            if self._end_validation(document_ids) != generations or stale:
+                # the document was updated while it was validated, errors may be of either side of the update.
+                return errors
+            if key in self._entries:
+                self._remove(key)
+            if version is None:
+                document_ids = ()
+            self._entries[key] = (tuple(errors), expires, document_ids)
+            for document_id in document_ids:
+                self._versions.setdefault(document_id, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return errors
+
+    def _start_validation(self, document_ids):
+        """Returns the generations of document_ids, which are tracked until _end_validation is called"""
+        generations = []
+        for document_id in document_ids:
+            entry = self._generations.get(document_id)
+            if entry is None:
+                entry = self._generations[document_id] = [0, 0]
+            entry[0] += 1
+            generations.append(entry[1])
+        return generations
+
+    def _end_validation(self, document_ids):
+        """Stops tracking document_ids, returns their generations"""
+        generations = []
+        for document_id in document_ids:
+            entry = self._generations[document_id]
+            generations.append(entry[1])
+            entry[0] -= 1
+            if entry[0] == 0:
+                del self._generations[document_id]
+        return generations
+
+    def is_document_valid(self, document, version=None):
+        """Same as is_document_valid of the model, using the cached errors"""
+        return len(self.get_document_errors(document, version=version)) == 0
+
+    def _remove(self, key):
+        errors, expires, document_ids = self._entries.pop(key)
+        for document_id in document_ids:
+            keys = self._versions.get(document_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._versions[document_id]
+
+    def invalidate(self, document=None, version=None):
+        """Drop the result of a document, or of a version. Returns True if a result was dropped."""
+        if version is not None:
+            key = ("version", version)
+        else:
+            key = self._key(document, None)
+        with self._lock:
+            dropped = key in self._entries
+            if dropped:
+                self._remove(key)
+            if document is not None:
+                dropped = self._drop_document(document) or dropped
+        return dropped
+
+    def _drop_document(self, document):
+        keys = self._versions.pop(id(document), ())
+        for key in keys:
+            if key in self._entries:
+                self._remove(key)
+        return len(keys) > 0
+
+    def document_updated(self, document):
+        """Called by update of the models once document is changed, drops the results of the versions containing it.
+
+        The results of the validations of document running at the same time are not stored.
+        """
+        if self._versions or self._generations:
+            with self._lock:
+                entry = self._generations.get(id(document))
+                if entry is not None:
+                    entry[1] += 1
+                self._drop_document(document)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            "size" : len(self._entries), "maxsize" : self.maxsize, "hits" : self.hits, "misses" : self.misses,
+            "evictions" : self.evictions, "expirations" : self.expirations, "uncacheable" : self.uncacheable,
+        }
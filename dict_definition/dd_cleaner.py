@@ -21,35 +21,77 @@
 
 from .defined_dict import *
 
+_LABEL_PLAN_CACHE_SIZE = 256
+
+
+def _apply_label_plan(document, plan):
+    remove, nested = plan
+    for key in remove:
+        if key in document:
+            document.pop(key)
+    for key, nested_plan in nested:
+        value = document.get(key)
+        if value is not None:
+            _apply_label_plan(value, nested_plan)
+
+
 class CleanerMixin(Mixin):
     """
     Cleaner mixin allows you to specify a label and allow you to run a "clean_label" method
     to clean inclusive/exclusive fields
+
+    The fields of each label and the nested models with this mixin are indexed when the class is created,
+    and each (labels, exclude) used with clean_labels is compiled into a removal plan that is cached.
     """
 
     @classmethod
     def _apply_mixin(cls, new_cls, name, bases, cdict):
+        label_index = {}
+        nested_models = []
         for key, definition in new_cls._fields.items():
             if hasattr(definition, "labels"):
-                if isinstance(definition.labels, str):
-                    definition.labels = set([definition.labels])
-                if not isinstance(definition.labels, set):
-                    definition.labels = set(definition.labels)
+                # the fields inherited from a base are shared between models, so labels is left as it was given.
+                labels = definition.labels
+                for label in ((labels, ) if isinstance(labels, str) else labels):
+                    label_index.setdefault(label, []).append(key)
+            if isinstance(definition, DefinedDictField) and CleanerMixin in definition.model._mixins:
+                nested_models.append((key, definition.model))
+        new_cls._label_index = { label : frozenset(keys) for label, keys in label_index.items() }
+        new_cls._label_models = tuple(nested_models)
+        new_cls._label_plans = {}
+
+    @classmethod
+    def _label_plan(cls, labels, exclude):
+        """Returns the removal plan of (labels, exclude), compiling it on the first call.
+
+        labels, exclude         frozenset of labels
+        The plan is (keys to remove, ((key, plan of the nested model), ...)), nested models with nothing to remove are skipped.
+        """
+        plans = cls._label_plans
+        plan = plans.get((labels, exclude))
+        if plan is None:
+            index = cls._label_index
+            removed = set()
+            for label in labels:
+                removed.update(index.get(label, ()))
+            for label in exclude:
+                removed.difference_update(index.get(label, ()))
+            nested = []
+            for key, model in cls._label_models:
+                nested_plan = model._label_plan(labels, exclude)
+                if nested_plan[0] or nested_plan[1]:
+                    nested.append((key, nested_plan))
+            plan = (tuple(key for key in cls._fields if key in removed), tuple(nested))
+            if len(plans) >= _LABEL_PLAN_CACHE_SIZE:
+                plans.clear()
+            plans[(labels, exclude)] = plan
+        return plan
 
     @classmethod
     def clean_labels(cls, document, labels, exclude=None):
-        exclude = exclude or set()
-        if exclude is not None and isinstance(exclude, str):
+        exclude = exclude or ()
+        if isinstance(exclude, str):
             exclude = (exclude, )
         if isinstance(labels, str):
             labels = (labels, )
-        labels = set(labels)
-        exclude = set(exclude)
-
-        for key, definition in cls._fields.items():
-            if key in document and hasattr(definition, "labels"):
-                if ((labels is None and len(definition.labels) > 0) or (len(labels & definition.labels) > 0)) and len(definition.labels & exclude) == 0:
-                    document.pop(key)
-            if isinstance(definition, DefinedDictField) and document.get(key) is not None and CleanerMixin in definition.model._mixins:
-                definition.model.clean_labels(document.get(key), labels, exclude=exclude)
-
+        _apply_label_plan(document, cls._label_plan(frozenset(labels), frozenset(exclude)))
@@ -0,0 +1,285 @@
+#           DO WHAT THE F*** YOU WANT TO PUBLIC LICENSE
+#                   Version 2, December 2004
+#
+# Copyright (C) 2015- ZwodahS(github.com/ZwodahS)
+# zwodahs.github.io
+#
+# Everyone is permitted to copy and distribute verbatim or modified
+# copies of this license document, and changing it is allowed as long
+# as the name is changed.
+#
+#           DO WHAT THE F*** YOU WANT TO PUBLIC LICENSE
+#   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#  0. You just DO WHAT THE F*** YOU WANT TO.
+#
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+Columnar batches of documents, for models that are mostly IntField/FloatField/BoolField.
+
+Each IntField/FloatField/BoolField of the model is stored as a typed array with a mask, and
+is_required/choices/min/max are checked across the whole column at once.
+NumPy is used when it is installed, otherwise the columns are array.array and the checks are plain loops.
+"""
+import array
+
+from .defined_dict import *
+from .defined_dict import _MISSING, _defined_in
+
+try:
+    import numpy
+except ImportError: # pragma: no cover
+    numpy = None
+
+MASK_PRESENT = 0
+MASK_NONE = 1
+MASK_MISSING = 2
+MASK_INT = 3 # an int stored in a FloatField column
+
+_KINDS = {
+    # kind : (allowed_type, typecode, type stored, numpy dtype)
+    "int" : ((int, ), "q", int, "int64"),
+    "float" : ((float, int), "d", float, "float64"),
+    "bool" : ((bool, ), "b", bool, "int8"),
+}
+
+
+def _column_kind(field):
+    """Returns the kind of typed column for field, or None if it needs to be stored as objects"""
+    if isinstance(field, FloatField):
+        kind = "float"
+    elif isinstance(field, IntField):
+        kind = "int"
+    elif isinstance(field, BoolField):
+        kind = "bool"
+    else:
+        return None
+    # subclasses that changed the checks are stored as objects.
+    if _defined_in(type(field), "errors") not in (NumberField, TypedField):
+        return None
+    if _defined_in(type(field), "_compile_checks") not in (NumberField, TypedField):
+        return None
+    if tuple(field.allowed_type) != _KINDS[kind][0]:
+        return None
+    return kind
+
+
+def _build_typed(kind, raw):
+    _, typecode, stored_type, _ = _KINDS[kind]
+    values = array.array(typecode)
+    mask = bytearray(len(raw))
+    append = values.append
+    try:
+        for ind, value in enumerate(raw):
+            if value is None:
+                mask[ind] = MASK_NONE
+                append(0)
+            elif value is _MISSING:
+                mask[ind] = MASK_MISSING
+                append(0)
+            elif type(value) is stored_type:
+                append(value)
+            elif kind == "float" and type(value) is int and -2 ** 53 <= value <= 2 ** 53:
+                mask[ind] = MASK_INT
+                append(value)
+            else:
+                return None
+    except OverflowError:
+        return None
+    return values, mask
+
+
+class _Column(object):
+
+    __slots__ = ("key", "field", "kind", "values", "mask", "plan")
+
+    def __init__(self, key, field, plan, documents, use_numpy):
+        self.key = key
+        self.field = field
+        self.plan = plan
+        raw = [ document.get(key, _MISSING) for document in documents ]
+        self.kind, self.values, self.mask = "object", raw, None
+        kind = _column_kind(field)
+        if kind is not None:
+            typed = _build_typed(kind, raw)
+            if typed is not None:
+                self.kind = kind
+                self.values, self.mask = typed
+                if use_numpy:
+                    self.values = numpy.frombuffer(self.values, dtype=_KINDS[kind][3])
+                    self.mask = numpy.frombuffer(self.mask, dtype=numpy.uint8)
+
+    def value_at(self, ind):
+        """Returns the value of the document at ind, _MISSING if the key is missing"""
+        if self.kind == "object":
+            return self.values[ind]
+        m = self.mask[ind]
+        if m == MASK_NONE:
+            return None
+        if m == MASK_MISSING:
+            return _MISSING
+        value = self.values[ind]
+        if self.kind == "int" or m == MASK_INT:
+            return int(value)
+        if self.kind == "float":
+            return float(value)
+        return bool(value)
+
+    def collect_errors(self, errors, use_numpy):
+        if self.kind == "object":
+            on_none, checks = self.plan
+            key = self.key
+            for value, out in zip(self.values, errors):
+                if value is None or value is _MISSING:
+                    if on_none is not None:
+                        on_none(None, key, out)
+                else:
+                    for check in checks:
+                        check(value, key, out)
+        elif use_numpy:
+            self._collect_errors_numpy(errors)
+        else:
+            self._collect_errors_python(errors)
+
+    def _bad_choices(self, values):
+        """Returns the distinct values that are not in choices, the same way as Field.errors checks them"""
+        choices = self.field.choices
+        convert = _KINDS[self.kind][2]
+        return [ v for v in values if convert(v) not in choices ]
+
+    def _append_errors(self, errors, indexes, choice_bad, range_bad):
+        key = self.key
+        for ind in indexes:
+            if choice_bad is not None and choice_bad[ind]:
+                errors[ind].append((key, Field.ERROR_VALUE, self.value_at(ind)))
+            if range_bad is not None and range_bad[ind]:
+                errors[ind].append((key, Field.ERROR_VALUE, self.value_at(ind)))
+
+    def _collect_errors_numpy(self, errors):
+        field, values, mask = self.field, self.values, self.mask
+        missing = (mask == MASK_NONE) | (mask == MASK_MISSING)
+        if field.is_required:
+            for ind in numpy.nonzero(missing)[0]:
+                errors[ind].append((self.key, Field.ERROR_IS_REQUIRED))
+        present = ~missing
+
+        choice_bad = range_bad = None
+        if field.choices is not None:
+            bad = self._bad_choices(numpy.unique(values[present]).tolist())
+            choice_bad = present & numpy.isin(values, bad)
+        min_value, max_value = getattr(field, "min", None), getattr(field, "max", None)
+        if min_value is not None or max_value is not None:
+            range_bad = numpy.zeros(len(values), dtype=bool)
+            if min_value is not None:
+                range_bad |= values < min_value
+            if max_value is not None:
+                range_bad |= values >= max_value
+            range_bad &= present
+        if choice_bad is None and range_bad is None:
+            return
+        if choice_bad is None:
+            combined = range_bad
+        elif range_bad is None:
+            combined = choice_bad
+        else:
+            combined = choice_bad | range_bad
+        self._append_errors(errors, numpy.nonzero(combined)[0].tolist(), choice_bad, range_bad)
+
+    def _collect_errors_python(self, errors):
+        field, values, mask = self.field, self.values, self.mask
+        if field.is_required:
+            for ind, m in enumerate(mask):
+                if m == MASK_NONE or m == MASK_MISSING:
+                    errors[ind].append((self.key, Field.ERROR_IS_REQUIRED))
+
+        choice_bad = range_bad = None
+        if field.choices is not None:
+            distinct = set(v for v, m in zip(values, mask) if m == MASK_PRESENT or m == MASK_INT)
+            bad = set(self._bad_choices(distinct))
+            choice_bad = bytearray((m == MASK_PRESENT or m == MASK_INT) and v in bad for v, m in zip(values, mask))
+        min_value, max_value = getattr(field, "min", None), getattr(field, "max", None)
+        if min_value is not None or max_value is not None:
+            range_bad = bytearray(
+                (m == MASK_PRESENT or m == MASK_INT) and
+                ((min_value is not None and v < min_value) or (max_value is not None and v >= max_value))
+                for v, m in zip(values, mask))
+        if choice_bad is None and range_bad is None:
+            return
+        indexes = [ ind for ind in range(len(mask)) if (choice_bad is not None and choice_bad[ind]) or
+                    (range_bad is not None and range_bad[ind]) ]
+        self._append_errors(errors, indexes, choice_bad, range_bad)
+
+
+class ColumnarBatch(object):
+    """A batch of documents of a model, stored as columns.
+
+    model                   The DefinedDict of the documents
+    documents               The documents, an iterable of dict
+    use_numpy               If None, NumPy is used when it is installed.
+
+    The columns of IntField/FloatField/BoolField are typed arrays (int64, float64, int8) with a mask
+    (MASK_PRESENT, MASK_NONE, MASK_MISSING or MASK_INT for an int in a FloatField). If a column contains
+    values that cannot be stored in the array (wrong types, bool in an IntField, int too large), or if the
+    field is a subclass with its own checks, it is stored as a list of values instead, like all the other fields.
+
+    get_errors returns the same errors as get_document_errors of each document, and to_documents
+    returns the same documents, including the keys that are not fields.
+    """
+
+    def __init__(self, model, documents, use_numpy=None):
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        if use_numpy and numpy is None:
+            raise DictValueError(message="NumPy is not installed")
+        documents = list(documents)
+        self.model = model
+        self.use_numpy = use_numpy
+        self._length = len(documents)
+        fields = model._fields
+        plans = { key : (on_none, checks) for key, on_none, checks in model._error_plan }
+        self._columns = [ _Column(key, field, plans[key], documents, use_numpy) for key, field in fields.items() ]
+        self._extras = [ { k : v for k, v in document.items() if k not in fields } for document in documents ]
+
+    def __len__(self):
+        return self._length
+
+    def column(self, key):
+        """Returns (values, mask) of a field, mask is None if the column is stored as a list of values"""
+        for column in self._columns:
+            if column.key == key:
+                return column.values, column.mask
+        raise KeyError(key)
+
+    def is_typed(self, key):
+        """Returns True if the column of key is stored as a typed array"""
+        return self.column(key)[1] is not None
+
+    def iter_documents(self):
+        for ind in range(self._length):
+            document = {}
+            for column in self._columns:
+                value = column.value_at(ind)
+                if value is not _MISSING:
+                    document[column.key] = value
+            document.update(self._extras[ind])
+            yield document
+
+    def to_documents(self):
+        return list(self.iter_documents())
+
+    def get_errors(self):
+        """Returns a list containing the errors of each document"""
+        if self.model._custom_errors:
+            return [ self.model.get_document_errors(document) for document in self.iter_documents() ]
+        errors = [ [] for _ in range(self._length) ]
+        for column in self._columns:
+            column.collect_errors(errors, self.use_numpy)
+        return errors
+
+    def is_valid(self):
+        """Returns a list containing whether each document is valid"""
+        return [ len(errors) == 0 for errors in self.get_errors() ]
@@ -0,0 +1,138 @@
+#           DO WHAT THE F*** YOU WANT TO PUBLIC LICENSE
+#                   Version 2, December 2004
+#
+# Copyright (C) 2015- ZwodahS(github.com/ZwodahS)
+# zwodahs.github.io
+#
+# Everyone is permitted to copy and distribute verbatim or modified
+# copies of this license document, and changing it is allowed as long
+# as the name is changed.
+#
+#           DO WHAT THE F*** YOU WANT TO PUBLIC LICENSE
+#   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#  0. You just DO WHAT THE F*** YOU WANT TO.
+#
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+Opt-in parallel validation and cleaning of large document sets.
+
+The documents are split into chunks that are sent to a ProcessPoolExecutor.
+Models are sent to the workers by reference, so they need to be defined at module level.
+"""
+import collections
+import concurrent.futures
+import itertools
+import os
+
+from .dd_cleaner import *
+
+
+def _validate_chunk(model, start, chunk):
+    return [ (start + index, errors) for index, errors in model.validate_many(chunk, batch_size=len(chunk)) ]
+
+
+def _clean_chunk(model, start, chunk, set_default, remove_undefined, labels, exclude):
+    output = []
+    for index, document in model.clean_many(chunk, set_default=set_default, remove_undefined=remove_undefined,
+                                            batch_size=len(chunk)):
+        if labels is not None and document is not None:
+            model.clean_labels(document, labels, exclude=exclude)
+        output.append((start + index, document))
+    return output
+
+
+class ParallelRunner(object):
+    """Runs validate_many/clean_many of a model across a pool of processes.
+
+    model                   The DefinedDict, needs to be defined at module level.
+    workers                 The number of processes, defaults to the number of cpus.
+    chunk_size              The number of documents sent to a worker at a time.
+    ordered                 If True, the results are yielded in the same order as the documents.
+                            If False, the results are yielded as soon as a chunk is done.
+    max_pending             The max number of chunks in flight, this bounds the memory used (default : workers * 2)
+    executor                An existing executor to use instead of creating one.
+
+    Both validate and clean yield (index, result), the same as validate_many and clean_many.
+    Since the documents are copied to the workers, clean returns the cleaned copies and does not modify the input.
+    """
+
+    def __init__(self, model, workers=None, chunk_size=1000, ordered=True, max_pending=None, executor=None):
+        if not isinstance(model, type) or not issubclass(model, DefinedDict):
+            raise DictValueError(message="Model for ParallelRunner needs to be a DefinedDict")
+        if "<locals>" in model.__qualname__:
+            raise DictValueError(message="Model for ParallelRunner needs to be defined at module level : {0}".format(model.__qualname__))
+        if chunk_size < 1:
+            raise DictValueError(message="Invalid value for chunk_size : {0}".format(chunk_size))
+        self.model = model
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = executor
+        self._owns_executor = executor is None
+        if self._owns_executor:
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        self.chunk_size = chunk_size
+        self.ordered = ordered
+        self.max_pending = max_pending or self.workers * 2
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._owns_executor:
+            self.executor.shutdown()
+
+    def validate(self, documents):
+        yield from self._run(_validate_chunk, documents)
+
+    def clean(self, documents, set_default=True, remove_undefined=True, labels=None, exclude=None):
+        """
+        labels, exclude         if labels is provided, clean_labels of the model is run on each document after cleaning.
+                                This requires the model to have the CleanerMixin.
+        """
+        if labels is not None and CleanerMixin not in self.model._mixins:
+            raise DictValueError(message="clean_labels requires {0} to have the CleanerMixin".format(self.model.__name__))
+        yield from self._run(_clean_chunk, documents, set_default, remove_undefined, labels, exclude)
+
+    def _run(self, func, documents, *args):
+        iterator = iter(documents)
+        start = 0
+        pending = collections.deque() if self.ordered else set()
+        while True:
+            while len(pending) < self.max_pending:
+                chunk = list(itertools.islice(iterator, self.chunk_size))
+                if not chunk:
+                    break
+                future = self.executor.submit(func, self.model, start, chunk, *args)
+                start += len(chunk)
+                if self.ordered:
+                    pending.append(future)
+                else:
+                    pending.add(future)
+            if not pending:
+                return
+            if self.ordered:
+                yield from pending.popleft().result()
+            else:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+
+
+def parallel_validate(model, documents, **kwargs):
+    """Validate documents with a ParallelRunner, see ParallelRunner for kwargs"""
+    with ParallelRunner(model, **kwargs) as runner:
+        yield from runner.validate(documents)
+
+
+def parallel_clean(model, documents, set_default=True, remove_undefined=True, labels=None, exclude=None, **kwargs):
+    """Clean documents with a ParallelRunner, see ParallelRunner for kwargs"""
+    with ParallelRunner(model, **kwargs) as runner:
+        yield from runner.clean(documents, set_default=set_default, remove_undefined=remove_undefined,
+                                labels=labels, exclude=exclude)
@@ -0,0 +1,160 @@
+#           DO WHAT THE F*** YOU WANT TO PUBLIC LICENSE
+#                   Version 2, December 2004
+#
+# Copyright (C) 2015- ZwodahS(github.com/ZwodahS)
+# zwodahs.github.io
+#
+# Everyone is permitted to copy and distribute verbatim or modified
+# copies of this license document, and changing it is allowed as long
+# as the name is changed.
+#
+#           DO WHAT THE F*** YOU WANT TO PUBLIC LICENSE
+#   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#  0. You just DO WHAT THE F*** YOU WANT TO.
+#
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+Streaming JSON Lines pipeline, cleaning and validating one record at a time.
+
+    stats = run_pipeline(User, "users.jsonl", cleaned_sink="clean.jsonl", errors_sink="errors.jsonl")
+    print(stats)
+
+Also available from the command line, see python -m dict_definition --help
+"""
+import contextlib
+import importlib
+import json
+import time
+
+from .dd_cleaner import *
+
+ERROR_JSON = "json"
+ERROR_EXCEPTION = "exception"
+
+
+class PipelineStats(object):
+    """Counters of a pipeline run
+
+    records                 the number of records read (blank lines are skipped)
+    valid                   the number of records written to the cleaned sink
+    invalid                 the number of records written to the errors sink
+    bytes                   the size of the input read, in characters for text input
+    seconds                 the time taken
+    """
+
+    def __init__(self):
+        self.records = 0
+        self.valid = 0
+        self.invalid = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    @property
+    def records_per_second(self):
+        return self.records / self.seconds if self.seconds else 0.0
+
+    @property
+    def mb_per_second(self):
+        return self.bytes / self.seconds / (1024 * 1024) if self.seconds else 0.0
+
+    def to_dict(self):
+        return {
+            "records" : self.records, "valid" : self.valid, "invalid" : self.invalid, "bytes" : self.bytes,
+            "seconds" : self.seconds, "records_per_second" : self.records_per_second, "mb_per_second" : self.mb_per_second,
+        }
+
+    def __str__(self):
+        return "{0} records ({1} invalid) in {2:.2f}s : {3:.1f} records/sec, {4:.2f} MB/s".format(
+            self.records, self.invalid, self.seconds, self.records_per_second, self.mb_per_second)
+
+
+def load_model(path):
+    """Load a DefinedDict from "package.module:ClassName" """
+    module_name, _, name = path.partition(":")
+    if not name:
+        raise DictValueError(message="Model needs to be in the form package.module:ClassName : {0}".format(path))
+    model = getattr(importlib.import_module(module_name), name, None)
+    if not isinstance(model, type) or not issubclass(model, DefinedDict):
+        raise DictValueError(message="{0} is not a DefinedDict".format(path))
+    return model
+
+
+@contextlib.contextmanager
+def _open(target, mode):
+    if target is None or not isinstance(target, str):
+        yield target
+    else:
+        with open(target, mode) as f:
+            yield f
+
+
+def iter_jsonl(source):
+    """Lazily yields (line number, size, record or exception) for each non blank line of a JSON Lines file/file object"""
+    with _open(source, "rb") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                record = e
+            yield line_number, len(line), record
+
+
+def run_pipeline(model, source, cleaned_sink=None, errors_sink=None, clean=True, validate=True,
+                 set_default=True, remove_undefined=True, labels=None, exclude=None):
+    """Read JSON Lines from source, clean and/or validate each record, and write them to the sinks.
+
+    model                   The DefinedDict of the records
+    source                  A path, or a file object (text or binary) with one JSON document per line
+    cleaned_sink            A path or a text file object, the valid records are written to it as JSON Lines.
+    errors_sink             A path or a text file object, a report is written to it for each invalid record :
+                            { "line" : line number, "errors" : [ errors from get_document_errors ] }
+                            A line that is not a JSON object is reported with the errors ["", "json"/"type", message]
+                            A record that makes clean_document or get_document_errors raise is reported with the
+                            errors ["", "exception", "ExceptionType: message"]
+    clean                   If True, clean_document is run on each record first.
+    validate                If True, get_document_errors is run on each (cleaned) record.
+    labels, exclude         If labels is provided, clean_labels is run on the valid records (requires CleanerMixin)
+
+    Only one record is held in memory at a time. Returns a PipelineStats.
+    """
+    if labels is not None and CleanerMixin not in model._mixins:
+        raise DictValueError(message="clean_labels requires {0} to have the CleanerMixin".format(model.__name__))
+    stats = PipelineStats()
+    start = time.perf_counter()
+    with _open(cleaned_sink, "w") as cleaned, _open(errors_sink, "w") as errors_output:
+        for line_number, size, record in iter_jsonl(source):
+            stats.records += 1
+            stats.bytes += size
+            if isinstance(record, Exception):
+                errors = [ ("", ERROR_JSON, str(record)) ]
+            elif not isinstance(record, dict):
+                errors = [ ("", Field.ERROR_TYPE, record) ]
+            else:
+                try:
+                    if clean:
+                        model.clean_document(record, set_default=set_default, remove_undefined=remove_undefined)
+                    errors = model.get_document_errors(record) if validate else []
+                except Exception as e:
+                    errors = [ ("", ERROR_EXCEPTION, "{0}: {1}".format(type(e).__name__, e)) ]
+
+            if errors:
+                stats.invalid += 1
+                if errors_output is not None:
+                    errors_output.write(json.dumps({ "line" : line_number, "errors" : errors }, default=str))
+                    errors_output.write("\n")
+            else:
+                stats.valid += 1
+                if labels is not None:
+                    model.clean_labels(record, labels, exclude=exclude)
+                if cleaned is not None:
+                    cleaned.write(json.dumps(record, default=str))
+                    cleaned.write("\n")
+    stats.seconds = time.perf_counter() - start
+    return stats
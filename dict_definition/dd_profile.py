@@ -0,0 +1,390 @@
+#           DO WHAT THE F*** YOU WANT TO PUBLIC LICENSE
+#                   Version 2, December 2004
+#
+# Copyright (C) 2015- ZwodahS(github.com/ZwodahS)
+# zwodahs.github.io
+#
+# Everyone is permitted to copy and distribute verbatim or modified
+# copies of this license document, and changing it is allowed as long
+# as the name is changed.
+#
+#           DO WHAT THE F*** YOU WANT TO PUBLIC LICENSE
+#   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#  0. You just DO WHAT THE F*** YOU WANT TO.
+#
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+Opt-in profiling of the models, with per-model and per-field counters and timings.
+
+    with Profiler() as profiler:
+        handle_requests()
+    print(profiler.top(10))
+    print(profiler.to_prometheus())
+
+While enabled, the compiled validation plans, the cleaning and update methods of the models and of the fields are
+replaced with timed wrappers. They are restored when disabled, so a disabled profiler costs nothing.
+"""
+import inspect
+import time
+
+from .defined_dict import *
+from .defined_dict import _defined_in
+
+_MISSING = object()
+
+_OPERATIONS = ("errors", "valid", "clean", "update")
+
+# the classmethods of the models that are timed, as (operation, method, kind), see _timed_classmethod.
+# The internal methods are timed rather than clean_document, replacing clean_document would make the models
+# look like they override it, see DefinedDict._clean_copy.
+_MODEL_METHODS = (
+    ("errors", "_collect_errors", "errors"),
+    ("valid", "_is_valid", "call"),
+    ("clean", "_clean_in_place", "call"),
+    ("clean", "_clean_copy", "call"),
+    ("clean", "_clean_steps", "steps"),
+    ("update", "update", "call"),
+)
+
+# the methods of the models overriding clean_document, which is timed as it is without changing how they are cleaned.
+_OVERRIDDEN_CLEAN_METHODS = (("clean", "clean_document", "call"), )
+
+_enabled = None
+
+
+def _model_name(model):
+    return "{0}:{1}".format(model.__module__, model.__qualname__)
+
+
+def _all_models(root=DefinedDict):
+    models = []
+    stack = list(root.__subclasses__())
+    while stack:
+        model = stack.pop()
+        if model not in models:
+            models.append(model)
+            stack.extend(model.__subclasses__())
+    return models
+
+
+class Timing(object):
+    """The counters of an operation
+
+    calls                   the number of calls
+    seconds                 the total time spent, including the nested models
+    values                  the number of values checked, the elements of ListField and MapField are counted
+                            (errors of the fields only)
+    errors                  the number of errors found, including the nested models (errors only)
+    """
+
+    __slots__ = ("calls", "seconds", "values", "errors")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.values = 0
+        self.errors = 0
+
+    def as_dict(self, operation, with_values=True):
+        output = { "calls" : self.calls, "seconds" : self.seconds }
+        if operation == "errors":
+            if with_values:
+                output["values"] = self.values
+            output["errors"] = self.errors
+        return output
+
+
+def _timed_check(check, timing, counts_elements):
+    """Wraps a check(value, key, out) of the validation plan"""
+    perf_counter = time.perf_counter
+    def timed(value, key, out):
+        before = len(out)
+        start = perf_counter()
+        try:
+            check(value, key, out)
+        finally:
+            timing.seconds += perf_counter() - start
+            timing.calls += 1
+            timing.values += len(value) if counts_elements and isinstance(value, (list, dict)) else 1
+            timing.errors += len(out) - before
+    return timed
+
+
+def _timed_checks(checks, timing, counts_elements):
+    if len(checks) == 1:
+        return _timed_check(checks[0], timing, counts_elements)
+    def check_all(value, key, out):
+        for check in checks:
+            check(value, key, out)
+    return _timed_check(check_all, timing, counts_elements)
+
+
+def _timed_validators(on_none, validators, timing):
+    """Wraps the (on_none, validators) of the fail fast plan"""
+    perf_counter = time.perf_counter
+    def timed(valid):
+        def timed_valid(value):
+            start = perf_counter()
+            try:
+                return valid(value)
+            finally:
+                timing.seconds += perf_counter() - start
+                timing.calls += 1
+        return timed_valid
+    def valid_all(value):
+        for valid in validators:
+            if not valid(value):
+                return False
+        return True
+    return (None if on_none is None else timed(on_none)), (timed(validators[0] if len(validators) == 1 else valid_all), )
+
+
+def _timed_function(function, timing):
+    """Wraps the clean/update of a field"""
+    perf_counter = time.perf_counter
+    def timed(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timing.seconds += perf_counter() - start
+            timing.calls += 1
+    return timed
+
+
+def _timed_steps(function, timing):
+    """Wraps a generator function, timing each step, so that the time spent between the steps is not counted"""
+    perf_counter = time.perf_counter
+    def timed(*args, **kwargs):
+        steps = function(*args, **kwargs)
+        timing.calls += 1
+        while True:
+            start = perf_counter()
+            try:
+                next(steps)
+            except StopIteration:
+                return
+            finally:
+                timing.seconds += perf_counter() - start
+            yield
+    return timed
+
+
+def _timed_classmethod(function, timing, kind):
+    """Wraps a classmethod of a model, function is the underlying function taking cls
+
+    kind                    "errors" for _collect_errors, "steps" for a generator, "call" for the others
+    """
+    perf_counter = time.perf_counter
+    if kind == "steps":
+        return classmethod(_timed_steps(function, timing))
+    if kind == "errors":
+        def timed(cls, document, parent, out):
+            before = len(out)
+            start = perf_counter()
+            try:
+                return function(cls, document, parent, out)
+            finally:
+                timing.seconds += perf_counter() - start
+                timing.calls += 1
+                timing.errors += len(out) - before
+    else:
+        def timed(cls, *args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(cls, *args, **kwargs)
+            finally:
+                timing.seconds += perf_counter() - start
+                timing.calls += 1
+    return classmethod(timed)
+
+
+def _field_methods(definition):
+    """Returns the (operation, method) timed on definition.
+
+    _cleaned and _clean_steps are timed as clean, unless they call clean (when clean is overridden without them).
+    """
+    cls = type(definition)
+    methods = [ ("clean", "clean"), ("update", "update") ]
+    if issubclass(_defined_in(cls, "_cleaned"), _defined_in(cls, "clean")):
+        methods.append(("clean", "_cleaned"))
+    steps_owner = _defined_in(cls, "_clean_steps")
+    if steps_owner is not Field and issubclass(steps_owner, _defined_in(cls, "clean")):
+        methods.append(("clean", "_clean_steps"))
+    return methods
+
+
+def _escape_label(value):
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class Profiler(object):
+    """Collects the counters of models while enabled.
+
+    models                  the models to profile, defaults to all the DefinedDict defined when enable is called.
+
+    The time of a model or a field includes the time of the nested models, which have their own counters as well.
+    A field inherited from a base model is shared, its counters are reported under the model that defines it.
+    Only one profiler can be enabled at a time. The counters are not locked, the counts of concurrent threads are
+    best effort.
+
+    The errors of a model are counted when it is called from get_document_errors or from a DefinedDictField.
+    validate_many runs the plan directly, so only the counters of its fields are updated.
+    The operation "valid" is is_document_valid, its counters only have calls and seconds.
+    The "clean" counters include clean_document in place and not in place, and aclean_document.
+
+    While enabled, the ColumnarBatch created are not profiled, as they compile the checks when created.
+    """
+
+    def __init__(self, models=None):
+        self.models = None if models is None else list(models)
+        self._model_timings = {}
+        self._field_timings = {}
+        self._saved = None
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *args):
+        self.disable()
+
+    @property
+    def enabled(self):
+        return self._saved is not None
+
+    def _timing(self, timings, name, operation):
+        key = name + (operation, )
+        timing = timings.get(key)
+        if timing is None:
+            timing = timings[key] = Timing()
+        return timing
+
+    def enable(self):
+        global _enabled
+        if _enabled is not None:
+            raise DictValueError(message="A Profiler is already enabled")
+        models = sorted(_all_models() if self.models is None else self.models, key=lambda m: len(m.__mro__))
+        owners = {}
+        for model in models:
+            for key, definition in model._fields.items():
+                owners.setdefault(id(definition), (definition, (_model_name(model), key)))
+
+        # read everything before replacing anything, so the wrappers of a model never call the wrappers of its base.
+        methods = { model : _OVERRIDDEN_CLEAN_METHODS + tuple(m for m in _MODEL_METHODS if m[0] != "clean")
+                    if _defined_in(model, "clean_document") is not DefinedDict else _MODEL_METHODS for model in models }
+        functions = { (model, method) : inspect.getattr_static(model, method).__func__
+                      for model in models for _, method, _ in methods[model] }
+        saved = []
+        for model in models:
+            name = (_model_name(model), )
+            plan = []
+            for key, on_none, checks in model._error_plan:
+                definition = model._fields[key]
+                timing = self._timing(self._field_timings, owners[id(definition)][1], "errors")
+                counts_elements = isinstance(definition, (ListField, MapField)) and definition.inner_type is not None
+                plan.append((
+                    key,
+                    None if on_none is None else _timed_check(on_none, timing, False),
+                    (_timed_checks(checks, timing, counts_elements), ),
+                ))
+            saved.append((model, "_error_plan", model.__dict__.get("_error_plan", _MISSING)))
+            model._error_plan = tuple(plan)
+            valid_plan = []
+            for key, on_none, validators in model._valid_plan:
+                timing = self._timing(self._field_timings, owners[id(model._fields[key])][1], "valid")
+                valid_plan.append((key, ) + _timed_validators(on_none, validators, timing))
+            saved.append((model, "_valid_plan", model.__dict__.get("_valid_plan", _MISSING)))
+            model._valid_plan = tuple(valid_plan)
+            for operation, method, kind in methods[model]:
+                saved.append((model, method, model.__dict__.get(method, _MISSING)))
+                timing = self._timing(self._model_timings, name, operation)
+                setattr(model, method, _timed_classmethod(functions[(model, method)], timing, kind))
+
+        for definition, name in owners.values():
+            for operation, method in _field_methods(definition):
+                saved.append((definition, method, definition.__dict__.get(method, _MISSING)))
+                timing = self._timing(self._field_timings, name, operation)
+                timed = _timed_steps if method == "_clean_steps" else _timed_function
+                setattr(definition, method, timed(getattr(definition, method), timing))
+        self._saved = saved
+        _enabled = self
+
+    def disable(self):
+        global _enabled
+        if self._saved is None:
+            return
+        for target, attribute, value in reversed(self._saved):
+            if value is _MISSING:
+                delattr(target, attribute)
+            else:
+                setattr(target, attribute, value)
+        self._saved = None
+        _enabled = None
+
+    def reset(self):
+        """Reset all the counters to 0"""
+        for timing in list(self._model_timings.values()) + list(self._field_timings.values()):
+            timing.__init__()
+
+    def as_dict(self):
+        """Returns the counters as
+
+            { model : { operation : counters, "fields" : { key : { operation : counters } } } }
+
+        See Timing for the counters, models and fields that were never called are included with 0.
+        """
+        output = {}
+        for (model, operation), timing in self._model_timings.items():
+            output.setdefault(model, { "fields" : {} })[operation] = timing.as_dict(operation, with_values=False)
+        for (model, key, operation), timing in self._field_timings.items():
+            fields = output.setdefault(model, { "fields" : {} })["fields"]
+            fields.setdefault(key, {})[operation] = timing.as_dict(operation)
+        return output
+
+    def top(self, count=10, operation="errors"):
+        """Returns the count fields with the most time spent in operation, as [ (model, key, counters) ]"""
+        fields = [ (model, key, timing.as_dict(operation)) for (model, key, op), timing in self._field_timings.items()
+                   if op == operation and timing.calls > 0 ]
+        fields.sort(key=lambda f: f[2]["seconds"], reverse=True)
+        return fields[:count]
+
+    def to_prometheus(self, prefix="defined_dict"):
+        """Returns the counters in the Prometheus text exposition format"""
+        metrics = {
+            "model_calls_total" : ("counter", "Number of calls of the models", []),
+            "model_seconds_total" : ("counter", "Time spent in the models, including nested models", []),
+            "model_errors_total" : ("counter", "Number of errors found by the models", []),
+            "field_calls_total" : ("counter", "Number of calls of the fields", []),
+            "field_seconds_total" : ("counter", "Time spent in the fields, including nested models", []),
+            "field_values_total" : ("counter", "Number of values checked by the fields", []),
+            "field_errors_total" : ("counter", "Number of errors found by the fields", []),
+        }
+        for (model, operation), timing in sorted(self._model_timings.items()):
+            labels = "model=\"{0}\",operation=\"{1}\"".format(_escape_label(model), operation)
+            metrics["model_calls_total"][2].append((labels, timing.calls))
+            metrics["model_seconds_total"][2].append((labels, timing.seconds))
+            if operation == "errors":
+                metrics["model_errors_total"][2].append(("model=\"{0}\"".format(_escape_label(model)), timing.errors))
+        for (model, key, operation), timing in sorted(self._field_timings.items()):
+            field_labels = "model=\"{0}\",field=\"{1}\"".format(_escape_label(model), _escape_label(key))
+            labels = "{0},operation=\"{1}\"".format(field_labels, operation)
+            metrics["field_calls_total"][2].append((labels, timing.calls))
+            metrics["field_seconds_total"][2].append((labels, timing.seconds))
+            if operation == "errors":
+                metrics["field_values_total"][2].append((field_labels, timing.values))
+                metrics["field_errors_total"][2].append((field_labels, timing.errors))
+
+        lines = []
+        for name, (metric_type, help_text, samples) in metrics.items():
+            name = "{0}_{1}".format(prefix, name)
+            lines.append("# HELP {0} {1}".format(name, help_text))
+            lines.append("# TYPE {0} {1}".format(name, metric_type))
+            for labels, value in samples:
+                lines.append("{0}{{{1}}} {2!r}".format(name, labels, value))
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,555 @@
+#           DO WHAT THE F*** YOU WANT TO PUBLIC LICENSE
+#                   Version 2, December 2004
+#
+# Copyright (C) 2015- ZwodahS(github.com/ZwodahS)
+# zwodahs.github.io
+#
+# Everyone is permitted to copy and distribute verbatim or modified
+# copies of this license document, and changing it is allowed as long
+# as the name is changed.
+#
+#           DO WHAT THE F*** YOU WANT TO PUBLIC LICENSE
+#   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#  0. You just DO WHAT THE F*** YOU WANT TO.
+#
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+Tests for dict_definition.
+
+Run with : python -m pytest dict_definition/dd_test.py
+       or : python -m dict_definition.dd_test
+"""
+import asyncio
+import concurrent.futures
+import contextlib
+import copy
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from dict_definition.defined_dict import *
+from dict_definition.defined_dict import _defined_in
+from dict_definition import dd_columnar
+from dict_definition.dd_cleaner import CleanerMixin
+from dict_definition import dd_pipeline
+from dict_definition.__main__ import main
+from dict_definition.dd_profile import Profiler
+from dict_definition.dd_cache import ValidationCache
+
+
+class RangeModel(DefinedDict):
+    """Model with a cross field check in _yield_errors"""
+    lo = IntField()
+    hi = IntField()
+
+    @classmethod
+    def _yield_errors(cls, document, parent=None):
+        yield from super()._yield_errors(document, parent=parent)
+        lo, hi = document.get("lo"), document.get("hi")
+        if lo is not None and hi is not None and lo > hi:
+            yield ("lo" if parent is None else parent + ".lo", Field.ERROR_VALUE, lo)
+
+
+class RangeHolder(DefinedDict):
+    r = DefinedDictField(RangeModel)
+    ranges = ListField(DefinedDictField(RangeModel))
+
+
+class TestYieldErrorsOverride(unittest.TestCase):
+
+    def test_top_level(self):
+        document = { "lo" : 5, "hi" : 1 }
+        self.assertEqual(RangeModel.get_document_errors(document), [ ("lo", "value", 5) ])
+        self.assertEqual(RangeModel.get_document_errors({ "lo" : 1, "hi" : 5 }), [])
+        self.assertEqual(list(RangeModel.validate_many([ document, { "lo" : 1, "hi" : 5 } ])),
+                [ (0, [ ("lo", "value", 5) ]), (1, []) ])
+        self.assertEqual(RangeModel.revalidate_document(document, [], [ "lo" ]), [ ("lo", "value", 5) ])
+        self.assertEqual(RangeModel.record_class().from_dict(document).get_errors(), [ ("lo", "value", 5) ])
+        self.assertEqual(dd_columnar.ColumnarBatch(RangeModel, [ document ], use_numpy=False).get_errors(),
+                [ [ ("lo", "value", 5) ] ])
+        self.assertEqual(asyncio.run(RangeModel.aget_document_errors(document)), [ ("lo", "value", 5) ])
+
+    def test_nested(self):
+        document = { "r" : { "lo" : 5, "hi" : 1 }, "ranges" : [ { "lo" : 1, "hi" : 2 }, { "lo" : 3, "hi" : 2 } ] }
+        expected = [ ("r.lo", "value", 5), ("ranges.1.lo", "value", 3) ]
+        self.assertEqual(RangeHolder.get_document_errors(document), expected)
+        self.assertEqual(list(RangeHolder.validate_many([ document ])), [ (0, expected) ])
+        self.assertEqual(asyncio.run(RangeHolder.aget_document_errors(document)), expected)
+        self.assertEqual(RangeHolder.revalidate_document(document, expected, [ "r.lo" ]),
+                [ ("ranges.1.lo", "value", 3), ("r.lo", "value", 5) ])
+        document["r"]["hi"] = 10
+        self.assertEqual(RangeHolder.revalidate_document(document, expected, [ "r.hi" ]), [ ("ranges.1.lo", "value", 3) ])
+
+    def test_is_valid(self):
+        self.assertFalse(RangeModel.is_document_valid({ "lo" : 5, "hi" : 1 }))
+        self.assertTrue(RangeModel.is_document_valid({ "lo" : 1, "hi" : 5 }))
+        self.assertFalse(RangeModel.is_document_valid({ "lo" : "x", "hi" : 5 }))
+        self.assertFalse(RangeModel.record_class().from_dict({ "lo" : 5, "hi" : 1 }).is_valid())
+        self.assertFalse(RangeHolder.is_document_valid({ "r" : { "lo" : 5, "hi" : 1 } }))
+        self.assertFalse(RangeHolder.is_document_valid({ "ranges" : [ { "lo" : 1, "hi" : 2 }, { "lo" : 3, "hi" : 2 } ] }))
+        self.assertTrue(RangeHolder.is_document_valid({ "r" : { "lo" : 1, "hi" : 1 }, "ranges" : [ { "lo" : 1 } ] }))
+
+
+class PausedModel(DefinedDict):
+    """Model that calls pause, if set, after reading the document and before returning its errors"""
+    n = IntField()
+    pause = None
+
+    @classmethod
+    def _yield_errors(cls, document, parent=None):
+        errors = list(super()._yield_errors(document, parent=parent))
+        if cls.pause is not None:
+            cls.pause()
+        yield from errors
+
+
+class TestValidationCache(unittest.TestCase):
+
+    def test_update_during_validation(self):
+        cache = ValidationCache(PausedModel)
+        started, proceed = threading.Event(), threading.Event()
+        def pause():
+            PausedModel.pause = None
+            started.set()
+            proceed.wait(5)
+        for version in (("doc", 1), None):
+            with self.subTest(version=version):
+                document = { "n" : 1 }
+                results = []
+                thread = threading.Thread(target=lambda: results.append(cache.get_document_errors(document, version=version)))
+                started.clear()
+                proceed.clear()
+                PausedModel.pause = pause
+                thread.start()
+                self.assertTrue(started.wait(5))
+                PausedModel.update(document, { "n" : "x" }) # the validation has read n = 1
+                proceed.set()
+                thread.join()
+                self.assertEqual(results, [ [] ])
+                self.assertEqual(cache.get_document_errors(document, version=version), [ ("n", "type", "x") ])
+                if version is not None:
+                    PausedModel.update(document, { "n" : 2 })
+                    self.assertEqual(cache.get_document_errors(document, version=version), [])
+        self.assertEqual(cache._generations, {})
+
+
+class TestCodec(unittest.TestCase):
+
+    def test_equal_choices_of_different_types(self):
+        field = Field(choices=[ 1, True, 2.0, 2, "2" ])
+        for value in field.choices:
+            code = field.encode_value(value)
+            decoded = field.decode_value(code)
+            self.assertEqual((type(decoded), decoded), (type(value), value))
+        self.assertEqual([ field.encode_value(v) for v in field.choices ], [ 0, 1, 2, 3, 4 ])
+        self.assertRaises(DictValueError, field.encode_value, 1.0)
+        self.assertRaises(DictValueError, field.decode_value, True)
+
+    def test_dict_choices(self):
+        field = Field(choices={ "one" : 1, "true" : True })
+        self.assertEqual(field.encode_value("true"), True)
+        self.assertEqual(field.decode_value(1), "one")
+        self.assertEqual(field.decode_value(True), "true")
+
+
+class TestRecord(unittest.TestCase):
+
+    def test_invalid_keys(self):
+        for key in ("a-b", "1x", "class", "from_dict", "__x", ""):
+            with self.subTest(key=key):
+                model = DefinedDictMetaClass("InvalidKeyModel", (DefinedDict, ), { key : IntField() })
+                self.assertRaises(DictFieldError, model.record_class)
+
+
+class SharedFieldModel(CleanerMixin, DefinedDict):
+    secret = StringField(labels=[ "private" ], min_length=2, choices=[ "ab", "cd" ])
+    items = ListField(inner_type=Field(choices=[ 1, 2 ]))
+    ranges = MapField(inner_type=DefinedDictField(RangeModel))
+
+
+class SharedFieldChild(SharedFieldModel):
+    pass
+
+
+class TestSharedFields(unittest.TestCase):
+
+    def test_fields_not_written_at_runtime(self):
+        fields = list(SharedFieldModel._fields.values())
+        fields += [ SharedFieldModel.items.inner_type, SharedFieldModel.ranges.inner_type ]
+        before = [ dict(vars(definition)) for definition in fields ]
+        self.assertEqual(SharedFieldModel.secret.labels, [ "private" ])
+        document = { "secret" : "ab", "items" : [ 1, 3 ], "ranges" : { "x" : { "lo" : 2, "hi" : 1 } } }
+        for model in (SharedFieldModel, SharedFieldChild):
+            errors = model.get_document_errors(document)
+            self.assertEqual(errors, [ ("items.1", "value", 3), ("ranges.x.lo", "value", 2) ])
+            self.assertEqual(asyncio.run(model.aget_document_errors(document)), errors)
+            # the re-checked errors are not in field order
+            self.assertEqual(sorted(model.revalidate_document(document, errors, [ "items.1", "ranges.x" ])), errors)
+            self.assertFalse(model.is_document_valid(document))
+            self.assertEqual(model.decode_document(model.encode_document({ "secret" : "cd" })), { "secret" : "cd" })
+            cleaned = dict(document)
+            model.clean_labels(cleaned, "private")
+            self.assertNotIn("secret", cleaned)
+        self.assertEqual([ dict(vars(definition)) for definition in fields ], before)
+
+
+class StringModel(DefinedDict):
+    code = StringField(regex=r"[a-z]+-[0-9]+")
+    short = StringField(min_length=2, max_length=4)
+    hexa = StringField(charset="0123456789abcdef")
+    name = StringField(is_required=True, max_length=3)
+    tags = ListField(inner_type=StringField(regex="[a-z]+", min_length=2, max_length=4, charset="abcdef"))
+
+
+class TestStringField(unittest.TestCase):
+
+    CASES = [
+        # (document, errors)
+        ({ "name" : "abc" }, []),
+        ({ "name" : None }, [ ("name", "required") ]),
+        ({}, [ ("name", "required") ]),
+        ({ "name" : "abcd" }, [ ("name", "value", "abcd") ]),
+        ({ "name" : 12 }, [ ("name", "type", 12) ]),
+        ({ "name" : "a", "code" : "ab-12" }, []),
+        ({ "name" : "a", "code" : "ab-12x" }, [ ("code", "value", "ab-12x") ]),
+        ({ "name" : "a", "code" : "AB-12" }, [ ("code", "value", "AB-12") ]),
+        ({ "name" : "a", "code" : None }, []),
+        ({ "name" : "a", "code" : b"ab-12" }, [ ("code", "type", b"ab-12") ]),
+        ({ "name" : "a", "short" : "ab" }, []),
+        ({ "name" : "a", "short" : "abcd" }, []),
+        ({ "name" : "a", "short" : "a" }, [ ("short", "value", "a") ]),
+        ({ "name" : "a", "short" : "abcde" }, [ ("short", "value", "abcde") ]),
+        ({ "name" : "a", "short" : [ "ab" ] }, [ ("short", "type", [ "ab" ]) ]),
+        ({ "name" : "a", "hexa" : "00ff" }, []),
+        ({ "name" : "a", "hexa" : "" }, []),
+        ({ "name" : "a", "hexa" : "0g0" }, [ ("hexa", "value", "0g0") ]),
+        ({ "name" : "a", "hexa" : "FF" }, [ ("hexa", "value", "FF") ]),
+        ({ "name" : "a", "hexa" : 255 }, [ ("hexa", "type", 255) ]),
+        ({ "name" : "a", "tags" : [ "ab", "abcd", None ] }, []),
+        ({ "name" : "a", "tags" : [ "a", "abcde", "ab1", "xy", "ab" ] },
+            [ ("tags.0", "value", "a"), ("tags.1", "value", "abcde"), ("tags.2", "value", "ab1"), ("tags.3", "value", "xy") ]),
+        ({ "name" : "a", "tags" : [ "ab", 1, "ab" ] }, [ ("tags.1", "type", 1) ]),
+    ]
+
+    def test_errors(self):
+        for document, errors in self.CASES:
+            with self.subTest(document=document):
+                self.assertEqual(StringModel.get_document_errors(document), errors)
+                self.assertEqual(list(StringModel._yield_errors(document)), errors)
+                self.assertEqual(StringModel.is_document_valid(document), not errors)
+                self.assertEqual(StringModel.record_class().from_dict(document).get_errors(), errors)
+
+    def test_validate_many(self):
+        documents = [ document for document, _ in self.CASES ]
+        self.assertEqual(list(StringModel.validate_many(documents, batch_size=4)),
+                [ (index, StringModel.get_document_errors(document)) for index, document in enumerate(documents) ])
+
+    def test_field_errors(self):
+        field = StringModel.short
+        self.assertEqual(list(field.errors("abcde")), [ "value" ])
+        self.assertEqual(list(field.errors("abcde", with_key="k")), [ ("k", "value", "abcde") ])
+        self.assertEqual(list(field.errors(None)), [])
+        self.assertTrue(field.is_valid_value("abc"))
+        self.assertFalse(field.is_valid_value(3))
+
+
+def _reference_clean_labels(model, document, labels, exclude=None):
+    """clean_labels checking every field on each call, as it was before the removal plans"""
+    labels = set((labels, ) if isinstance(labels, str) else labels)
+    exclude = set((exclude, ) if isinstance(exclude, str) else exclude or ())
+    for key, definition in model._fields.items():
+        if key in document and hasattr(definition, "labels"):
+            field_labels = set((definition.labels, ) if isinstance(definition.labels, str) else definition.labels)
+            if len(labels & field_labels) > 0 and len(field_labels & exclude) == 0:
+                document.pop(key)
+        if isinstance(definition, DefinedDictField) and document.get(key) is not None and CleanerMixin in definition.model._mixins:
+            _reference_clean_labels(definition.model, document.get(key), labels, exclude=exclude)
+
+
+class LabelledAddress(CleanerMixin, DefinedDict):
+    street = StringField(labels="private")
+    city = StringField()
+    code = StringField(labels=("private", "internal"))
+
+
+class LabelledUser(CleanerMixin, DefinedDict):
+    name = StringField()
+    email = StringField(labels=[ "private" ])
+    token = StringField(labels={ "internal" })
+    address = DefinedDictField(LabelledAddress)
+    addresses = ListField(inner_type=DefinedDictField(LabelledAddress), labels="bulk")
+    by_name = MapField(inner_type=DefinedDictField(LabelledAddress))
+
+
+class TestCleanLabels(unittest.TestCase):
+
+    def test_same_as_reference(self):
+        address = { "street" : "s", "city" : "c", "code" : "0" }
+        document = {
+            "name" : "n", "email" : "e", "token" : "t", "undefined" : 1,
+            "address" : dict(address), "addresses" : [ dict(address), dict(address) ], "by_name" : { "a" : dict(address) },
+        }
+        cases = [
+            ("private", None), ([ "private" ], "internal"), ([ "private", "internal" ], None), ("internal", [ "private" ]),
+            ("bulk", None), ([ "bulk", "private" ], "internal"), ("unknown", None), ([], None),
+        ]
+        for labels, exclude in cases:
+            with self.subTest(labels=labels, exclude=exclude):
+                expected = copy.deepcopy(document)
+                _reference_clean_labels(LabelledUser, expected, labels, exclude=exclude)
+                cleaned = copy.deepcopy(document)
+                LabelledUser.clean_labels(cleaned, labels, exclude=exclude)
+                self.assertEqual(cleaned, expected)
+        cleaned = copy.deepcopy(document)
+        LabelledUser.clean_labels(cleaned, "private", exclude="internal")
+        self.assertEqual(cleaned["address"], { "city" : "c", "code" : "0" })
+        self.assertNotIn("email", cleaned)
+        self.assertEqual(cleaned["addresses"], document["addresses"]) # list and map values are not cleaned
+        self.assertEqual(cleaned["by_name"], document["by_name"])
+
+    def test_missing_and_none_nested(self):
+        for document in ({ "address" : None, "email" : None }, {}, { "address" : {} }):
+            expected = copy.deepcopy(document)
+            _reference_clean_labels(LabelledUser, expected, "private")
+            LabelledUser.clean_labels(document, "private")
+            self.assertEqual(document, expected)
+
+
+class AsyncLeaf(DefinedDict):
+    value = IntField(is_required=True)
+    label = StringField(default="leaf", max_length=4)
+
+
+class AsyncRoot(DefinedDict):
+    name = StringField(is_required=True)
+    leaf = DefinedDictField(AsyncLeaf)
+    leaves = ListField(inner_type=DefinedDictField(AsyncLeaf))
+    by_key = MapField(inner_type=DefinedDictField(AsyncLeaf))
+    numbers = ListField(inner_type=IntField())
+
+
+class TestAsync(unittest.TestCase):
+
+    DOCUMENTS = [
+        { "name" : "valid", "leaf" : { "value" : 1 }, "leaves" : [ { "value" : 2 } ], "by_key" : { "a" : { "value" : 3 } } },
+        {
+            "name" : None, "undefined" : 1,
+            "leaf" : { "value" : "x", "label" : "too long", "undefined" : 2 },
+            "leaves" : [ { "value" : i } if i % 3 else { "label" : i } for i in range(50) ] + [ "not a dict" ],
+            "by_key" : { "k%d" % i : { "value" : None if i % 2 else i, "undefined" : i } for i in range(20) },
+            "numbers" : list(range(30)) + [ "x", None ],
+        },
+        {},
+    ]
+
+    def _run_modes(self, run):
+        """Returns the results of run(mode, yield_every, executor) in each mode"""
+        async def main():
+            with concurrent.futures.ThreadPoolExecutor(2) as executor:
+                return [
+                    await run(ASYNC_COOPERATIVE, 1, None),
+                    await run(ASYNC_COOPERATIVE, 7, None),
+                    await run(ASYNC_EXECUTOR, 1000, None),
+                    await run(ASYNC_EXECUTOR, 1000, executor),
+                ]
+        return asyncio.run(main())
+
+    def test_aget_document_errors(self):
+        for document in self.DOCUMENTS:
+            expected = AsyncRoot.get_document_errors(document)
+            results = self._run_modes(lambda mode, yield_every, executor: AsyncRoot.aget_document_errors(
+                document, mode=mode, yield_every=yield_every, executor=executor))
+            for errors in results:
+                self.assertEqual(errors, expected)
+        self.assertNotEqual(AsyncRoot.get_document_errors(self.DOCUMENTS[1]), [])
+
+    def test_aclean_document(self):
+        for document in self.DOCUMENTS:
+            for set_default, remove_undefined in ((True, True), (False, True), (True, False)):
+                expected = AsyncRoot.clean_document(copy.deepcopy(document), set_default=set_default,
+                                                    remove_undefined=remove_undefined)
+                async def run(mode, yield_every, executor):
+                    cleaned = copy.deepcopy(document)
+                    result = await AsyncRoot.aclean_document(cleaned, set_default=set_default, remove_undefined=remove_undefined,
+                                                             mode=mode, yield_every=yield_every, executor=executor)
+                    self.assertIs(result, cleaned)
+                    return result
+                for cleaned in self._run_modes(run):
+                    self.assertEqual(cleaned, expected)
+
+    def test_invalid_mode(self):
+        self.assertRaises(DictValueError, asyncio.run, AsyncRoot.aget_document_errors({}, mode="threads"))
+        self.assertRaises(DictValueError, asyncio.run, AsyncRoot.aclean_document({}, yield_every=0))
+
+
+class ExplodingField(Field):
+    """Field that raises on the value "boom\""""
+
+    def errors(self, value, with_key=None):
+        if value == "boom":
+            raise ValueError("boom")
+        yield from super().errors(value, with_key)
+
+
+class PipelineUser(CleanerMixin, DefinedDict):
+    name = StringField(is_required=True)
+    email = StringField(labels="private")
+    role = StringField(default="user")
+    extra = ExplodingField()
+
+
+PIPELINE_INPUT = b"""{"name" : "a", "email" : "a@example.com", "undefined" : 1}
+{"email" : "b@example.com"}
+
+{"name" : "c",
+[1, 2]
+{"name" : "d", "extra" : "boom"}
+{"name" : "e", "role" : "admin"}
+"""
+
+
+class TestPipeline(unittest.TestCase):
+
+    def _check_errors(self, lines):
+        reports = [ json.loads(line) for line in lines ]
+        self.assertEqual([ report["line"] for report in reports ], [ 2, 4, 5, 6 ])
+        self.assertEqual(reports[0]["errors"], [ [ "name", "required" ] ])
+        self.assertEqual(reports[1]["errors"][0][:2], [ "", dd_pipeline.ERROR_JSON ])
+        self.assertEqual(reports[2]["errors"], [ [ "", "type", [ 1, 2 ] ] ])
+        self.assertEqual(reports[3]["errors"], [ [ "", dd_pipeline.ERROR_EXCEPTION, "ValueError: boom" ] ])
+
+    def test_run_pipeline(self):
+        cleaned, errors = io.StringIO(), io.StringIO()
+        stats = dd_pipeline.run_pipeline(PipelineUser, io.BytesIO(PIPELINE_INPUT), cleaned_sink=cleaned, errors_sink=errors)
+        self.assertEqual((stats.records, stats.valid, stats.invalid, stats.bytes), (6, 2, 4, len(PIPELINE_INPUT) - 1))
+        self.assertEqual([ json.loads(line) for line in cleaned.getvalue().splitlines() ], [
+            { "name" : "a", "email" : "a@example.com", "role" : "user", "extra" : None },
+            { "name" : "e", "email" : None, "role" : "admin", "extra" : None },
+        ])
+        self._check_errors(errors.getvalue().splitlines())
+
+    def test_options(self):
+        cleaned = io.StringIO()
+        stats = dd_pipeline.run_pipeline(PipelineUser, io.BytesIO(PIPELINE_INPUT), cleaned_sink=cleaned,
+                                         set_default=False, remove_undefined=False, labels=[ "private" ])
+        self.assertEqual((stats.valid, stats.invalid), (2, 4))
+        self.assertEqual([ json.loads(line) for line in cleaned.getvalue().splitlines() ],
+                         [ { "name" : "a", "undefined" : 1 }, { "name" : "e", "role" : "admin" } ])
+        stats = dd_pipeline.run_pipeline(PipelineUser, io.BytesIO(PIPELINE_INPUT), clean=False, validate=False)
+        self.assertEqual((stats.valid, stats.invalid), (4, 2))
+        self.assertRaises(DictValueError, dd_pipeline.run_pipeline, RangeModel, io.BytesIO(b""), labels=[ "private" ])
+
+    def test_main(self):
+        model = "{0}:PipelineUser".format(__name__)
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "input.jsonl")
+            output = os.path.join(directory, "cleaned.jsonl")
+            errors = os.path.join(directory, "errors.jsonl")
+            with open(source, "wb") as f:
+                f.write(PIPELINE_INPUT)
+            self.assertEqual(main([ model, source, "-o", output, "-e", errors, "-q", "--labels", "private" ]), 1)
+            with open(output) as f:
+                self.assertEqual([ json.loads(line) for line in f ], [
+                    { "name" : "a", "role" : "user", "extra" : None },
+                    { "name" : "e", "role" : "admin", "extra" : None },
+                ])
+            with open(errors) as f:
+                self._check_errors(f.read().splitlines())
+
+            with open(source, "wb") as f:
+                f.write(b'{"name" : "a"}\n\n{"name" : "b"}\n')
+            self.assertEqual(main([ model, source, "-o", output, "-q" ]), 0)
+            with open(output) as f:
+                self.assertEqual([ json.loads(line)["name"] for line in f ], [ "a", "b" ])
+
+    def test_main_invalid_model(self):
+        with contextlib.redirect_stderr(io.StringIO()):
+            for model in ("dict_definition.dd_test", "dict_definition.dd_test:ExplodingField", "no_such_module:Model"):
+                with self.assertRaises(SystemExit) as raised:
+                    main([ model, "-" ])
+                self.assertEqual(raised.exception.code, 2)
+
+
+class ProfiledLeaf(DefinedDict):
+    value = IntField()
+    tag = StringField(default="t")
+
+
+class ProfiledRoot(DefinedDict):
+    name = StringField(is_required=True)
+    leaf = DefinedDictField(ProfiledLeaf)
+    leaves = ListField(inner_type=DefinedDictField(ProfiledLeaf))
+    numbers = ListField(inner_type=IntField())
+
+
+class TestProfiler(unittest.TestCase):
+
+    def _calls(self, profiler):
+        """The counters of the profiler, without the seconds"""
+        output = profiler.as_dict()
+        def calls(counters):
+            return { operation : { k : v for k, v in c.items() if k != "seconds" } for operation, c in counters.items() }
+        return {
+            model.rpartition(":")[2] : dict(calls({ k : v for k, v in counters.items() if k != "fields" }),
+                                            fields={ key : calls(c) for key, c in counters["fields"].items() })
+            for model, counters in output.items()
+        }
+
+    def test_counters(self):
+        document = { "name" : "a", "leaf" : { "value" : 1 }, "leaves" : [ { "value" : 2 }, { "value" : "x" } ], "numbers" : [ 1 ] }
+        original = copy.deepcopy(document)
+        with Profiler(models=[ ProfiledRoot, ProfiledLeaf ]) as profiler:
+            self.assertIs(_defined_in(ProfiledRoot, "clean_document"), DefinedDict)
+            self.assertEqual(ProfiledRoot.get_document_errors(document), [ ("leaves.1.value", "type", "x") ])
+            self.assertFalse(ProfiledRoot.is_document_valid(document))
+            cleaned = ProfiledRoot.clean_document(document, in_place=False)
+            self.assertEqual(document, original)
+            self.assertEqual(cleaned["leaf"], { "value" : 1, "tag" : "t" })
+            self.assertIs(cleaned["numbers"], document["numbers"]) # copied on change only, not deep copied
+            asyncio.run(ProfiledRoot.aclean_document(copy.deepcopy(document), yield_every=1))
+            ProfiledRoot.clean_document(copy.deepcopy(document))
+
+        def field(errors, valid, clean, values=1, errors_found=0):
+            return {
+                "errors" : { "calls" : errors, "values" : values, "errors" : errors_found },
+                "valid" : { "calls" : valid }, "clean" : { "calls" : clean }, "update" : { "calls" : 0 },
+            }
+        self.assertEqual(self._calls(profiler), {
+            "ProfiledRoot" : {
+                "errors" : { "calls" : 1, "errors" : 1 }, "valid" : { "calls" : 1 }, "clean" : { "calls" : 3 },
+                "update" : { "calls" : 0 },
+                "fields" : {
+                    "name" : field(1, 1, 3),
+                    "leaf" : field(1, 1, 3),
+                    "leaves" : field(1, 1, 3, values=2, errors_found=1),
+                    "numbers" : field(1, 0, 3), # is_document_valid stops at leaves
+                },
+            },
+            "ProfiledLeaf" : {
+                # leaf and the 2 leaves are validated, only leaf is cleaned as ListField does not clean its values
+                "errors" : { "calls" : 3, "errors" : 1 }, "valid" : { "calls" : 3 }, "clean" : { "calls" : 3 },
+                "update" : { "calls" : 0 },
+                "fields" : {
+                    "value" : field(3, 3, 3, values=3, errors_found=1),
+                    "tag" : field(0, 0, 3, values=0),
+                },
+            },
+        })
+        for model in (ProfiledRoot, ProfiledLeaf):
+            for attribute in ("_error_plan", "_valid_plan", "_collect_errors", "_is_valid", "_clean_in_place", "_clean_copy",
+                              "_clean_steps", "clean_document", "update"):
+                self.assertEqual(attribute in vars(model), attribute in ("_error_plan", "_valid_plan"))
+            for definition in model._fields.values():
+                self.assertFalse({ "clean", "_cleaned", "_clean_steps", "update" } & set(vars(definition)))
+
+
+if __name__ == "__main__":
+    unittest.main()
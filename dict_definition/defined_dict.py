@@ -19,14 +19,32 @@
 # To Public License, Version 2, as published by Sam Hocevar. See
 # http://sam.zoy.org/wtfpl/COPYING for more details.
 import re
+import asyncio
+import collections.abc
+import copy
 import datetime
+import functools
+import itertools
+import keyword
 import logging
+import operator
+import types
+import weakref
 
 """
 Note:
 
     1.  Most of the code treat missing key and None value as the same thing.
         For example : is_required field.
+
+    2.  Thread safety : the metadata of a model is frozen when the class is created. _fields is a read only mapping,
+        _mixins is a tuple and the compiled plans are tuples, so they can be shared by any number of threads.
+        get_document_errors, is_document_valid, validate_many, clean_document, clean_labels, make_default and
+        the dict_utils filters/projections can be called concurrently, as long as a document is not modified by
+        a thread while another one is using it. Fields compile some of their checks lazily, these are the same
+        whichever thread builds them, so a race only compiles them twice.
+        The models and fields should not be modified after the class is created, the Profiler (dd_profile)
+        replaces some of their attributes while enabled.
 """
 #################################### Exceptions ####################################
 class DictFieldError(Exception):
@@ -48,6 +66,105 @@ class DictValueError(Exception):
 
 
 #################################### Fields ####################################
+def _append_required(value, key, out):
+    out.append((key, Field.ERROR_IS_REQUIRED))
+
+
+_MISSING = object()
+
+
+def _same_value(old, new):
+    """Returns True if old and new are equal and of the same type, all the way down like dict_utils.dict_equal.
+
+    1 and 1.0 are different, and so are [1] and [1.0].
+    """
+    stack = [(old, new)]
+    pop, push = stack.pop, stack.append
+    while stack:
+        a, b = pop()
+        if a is b:
+            continue
+        if type(a) != type(b):
+            return False
+        if type(a) is dict:
+            if len(a) != len(b):
+                return False
+            for k, v in a.items():
+                w = b.get(k, _MISSING)
+                if w is _MISSING:
+                    return False
+                push((v, w))
+        elif type(a) in (list, tuple):
+            if len(a) != len(b):
+                return False
+            for v, w in zip(a, b):
+                push((v, w))
+        elif a != b:
+            return False
+    return True
+
+
+def _record_change(changes, path, old, new):
+    """Record path in changes if the value changed, a None value is recorded as unset"""
+    if new is _MISSING or new is None:
+        if old is not new:
+            changes[path] = None
+    elif not _same_value(old, new):
+        changes[path] = new
+
+
+_IMMUTABLE_TYPES = (type(None), bool, int, float, complex, str, bytes, datetime.datetime, datetime.date, datetime.time)
+
+
+def _is_immutable(value):
+    if isinstance(value, _IMMUTABLE_TYPES):
+        return True
+    if type(value) in (tuple, frozenset):
+        return all(_is_immutable(v) for v in value)
+    return False
+
+
+def _compile_constant(value):
+    """Returns (constant, factory) for a default value, see Field._compile_default
+
+    list, dict and set are copied for each document, shallowly if they only contain immutable values.
+    Other values are shared, the same as before.
+    """
+    if type(value) in (list, dict, set):
+        values = value.values() if type(value) is dict else value
+        if all(_is_immutable(v) for v in values):
+            return None, functools.partial(type(value), value)
+        return None, functools.partial(copy.deepcopy, value)
+    return value, None
+
+
+def _reject(value):
+    return False
+
+
+def _hashed_choices(choices):
+    """Returns choices as a frozenset for O(1) lookups if it is a list, tuple or set of hashable values, otherwise choices"""
+    if isinstance(choices, (list, tuple, set)):
+        try:
+            return frozenset(choices)
+        except TypeError:
+            return choices
+    return choices
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_pattern(pattern, flags=0):
+    """Compile a regex, identical patterns share the same compiled object across all the fields"""
+    return re.compile(pattern, flags)
+
+
+def _defined_in(cls, attribute):
+    for c in cls.__mro__:
+        if attribute in c.__dict__:
+            return c
+    return None
+
+
 class Field(object):
 
     ERROR_IS_REQUIRED = "required"
@@ -62,6 +179,8 @@ class Field(object):
     is_required                 if true, None value or missing key is not allowed.
     choices                     defines the valid fields for this field.
                                 if choices is a dict, a reversed_choices is will also be created.
+                                list, tuple and set of hashable values are looked up with a frozenset.
+                                choices is also used to encode the values to compact codes, see encode_value.
     default                     default value for this field, either a callable or a value.
                                 for callable, a single parameter containing the instance of the field will be provided.
     """
@@ -73,10 +192,24 @@ class Field(object):
 
         if isinstance(choices, dict):
             self.reversed_choices = { v : k for k, v in choices.items() }
+        self._choices_lookup()
 
         for k, v in kwargs.items():
             setattr(self, k, v)
 
+    def _choices_lookup(self):
+        """Returns the hashed lookup of choices, rebuilt if choices was replaced, see _hashed_choices"""
+        cached = self.__dict__.get("_choices_cache")
+        if cached is None or cached[0] is not self.choices:
+            cached = self._choices_cache = (self.choices, _hashed_choices(self.choices))
+        return cached[1]
+
+    def _in_choices(self, value):
+        try:
+            return value in self._choices_lookup()
+        except TypeError: # unhashable value, compared the same way as before
+            return value in self.choices
+
     def errors(self, value, with_key=None):
         if value is None:
             if self.is_required:
@@ -85,7 +218,7 @@ class Field(object):
                 else:
                     yield Field.ERROR_IS_REQUIRED
         else:
-            if self.choices is not None and value not in self.choices:
+            if self.choices is not None and not self._in_choices(value):
                 if with_key is not None:
                     yield (with_key, Field.ERROR_VALUE, value)
                 else:
@@ -94,6 +227,117 @@ class Field(object):
     def get_errors(self, value):
         return list(self.errors(value))
 
+    def _compile_checks(self):
+        """Returns the list of checks to run on a non None value.
+
+        Each check is a function check(value, key, out) that appends the error tuples to out.
+        Subclasses that override errors should override this as well, otherwise the field will
+        be compiled to call errors directly.
+        """
+        checks = []
+        if self.choices is not None:
+            choices, lookup = self.choices, self._choices_lookup()
+            def check_choices(value, key, out):
+                try:
+                    found = value in lookup
+                except TypeError: # unhashable value, compared the same way as before
+                    found = value in choices
+                if not found:
+                    out.append((key, Field.ERROR_VALUE, value))
+            checks.append(check_choices)
+        return checks
+
+    def _compile_plan(self):
+        """Returns (on_none, checks) used by the compiled validation plan of DefinedDict.
+
+        on_none                 None, or a check to run when the value is None.
+        checks                  tuple of checks to run when the value is not None.
+        """
+        errors_owner = _defined_in(type(self), "errors")
+        checks_owner = _defined_in(type(self), "_compile_checks")
+        if not issubclass(checks_owner, errors_owner):
+            # errors is overridden without a compiled counterpart, fallback to the generators.
+            errors = self.errors
+            def check_errors(value, key, out):
+                out.extend(errors(value, key))
+            return check_errors, (check_errors, )
+        return (_append_required if self.is_required else None), tuple(self._compile_checks())
+
+    def compile_errors(self):
+        """Compile this field into a single function check(value, key, out).
+
+        The function appends the same error tuples as errors(value, with_key=key) to out.
+        The field is compiled as it is when this is called, changes made to the field afterwards are not reflected.
+        """
+        on_none, checks = self._compile_plan()
+        if len(checks) == 1:
+            check0 = checks[0]
+            def check(value, key, out):
+                if value is None:
+                    if on_none is not None:
+                        on_none(value, key, out)
+                else:
+                    check0(value, key, out)
+        else:
+            def check(value, key, out):
+                if value is None:
+                    if on_none is not None:
+                        on_none(value, key, out)
+                else:
+                    for c in checks:
+                        c(value, key, out)
+        return check
+
+    def _compiled_errors(self):
+        check = self.__dict__.get("_compiled_check")
+        if check is None:
+            check = self._compiled_check = self.compile_errors()
+        return check
+
+    def _build_caches(self):
+        """Build the compiled functions cached on this field, called when a model using this field is created.
+
+        A field is shared by the models inheriting it, so its caches are built once, before any document is checked,
+        instead of being written on the first call. Containers also build the caches of their inner fields.
+        """
+        self._compiled_errors()
+        self._codec()
+
+    def _revalidate(self, value, key, rest, out, rechecked):
+        """Re-check the part of value at the path rest, see DefinedDict.revalidate_document.
+
+        key                     the key string of value.
+        rest                    the remaining segments of the changed path under value.
+        rechecked               the key strings that are re-checked are appended to this.
+
+        By default, the whole value is re-checked.
+        """
+        rechecked.append(key)
+        self._compiled_errors()(value, key, out)
+
+    def _error_steps(self, value, key, out):
+        """Generator running the same checks as compile_errors, yielding after each unit of work.
+
+        Used by the cooperative mode of DefinedDict.aget_document_errors.
+        Containers override this to yield once per element instead of once for the whole value.
+        """
+        self._compiled_errors()(value, key, out)
+        yield
+
+    def _outer_checks(self, owner):
+        """Returns the compiled checks of a container without its last (inner) check.
+
+        Returns None if owner is not the class that defines errors and _compile_checks,
+        in which case the container is checked as a whole.
+        """
+        cls = type(self)
+        if _defined_in(cls, "_compile_checks") is not owner or _defined_in(cls, "errors") is not owner:
+            return None
+        checks = self.__dict__.get("_outer_checks_cache")
+        if checks is None:
+            checks = self._outer_checks_cache = tuple(self._compile_checks())[:-1]
+        return checks
+
     def is_valid_value(self, value):
         try:
             next(self.errors(value))
@@ -101,22 +345,184 @@ class Field(object):
         except StopIteration:
             return True
 
+    def _compile_validators(self):
+        """Returns the list of validators to run on a non None value.
+
+        Each validator is a function valid(value) that returns False on the first failure found.
+        Unlike the checks, validators never build keys or error tuples.
+        """
+        validators = []
+        if self.choices is not None:
+            choices, lookup = self.choices, self._choices_lookup()
+            def valid_choices(value):
+                try:
+                    return value in lookup
+                except TypeError:
+                    return value in choices
+            validators.append(valid_choices)
+        return validators
+
+    def _compile_validity(self):
+        """Returns (on_none, validators) used by the fail fast plan of DefinedDict.
+
+        on_none                 None if a None value is valid, otherwise a validator to run on None.
+        validators              tuple of validators to run when the value is not None.
+        """
+        errors_owner = _defined_in(type(self), "errors")
+        validators_owner = _defined_in(type(self), "_compile_validators")
+        if not issubclass(validators_owner, errors_owner):
+            errors = self.errors
+            def valid_errors(value):
+                for error in errors(value, None):
+                    return False
+                return True
+            return valid_errors, (valid_errors, )
+        return (_reject if self.is_required else None), tuple(self._compile_validators())
+
+    def compile_validator(self):
+        """Compile this field into a single function valid(value).
+
+        The function returns the same result as is_valid_value, stopping at the first failure.
+        """
+        on_none, validators = self._compile_validity()
+        def valid(value):
+            if value is None:
+                return on_none is None or on_none(value)
+            for v in validators:
+                if not v(value):
+                    return False
+            return True
+        return valid
+
+    def _compile_batch_validator(self):
+        """Returns a function valid_all(values) used by ListField to check a whole list at once, or None.
+
+        valid_all returns True if all the values are valid. When it returns False, the values are checked one by one.
+        """
+        return None
+
+    def _compile_codec(self):
+        """Returns (encode, decode) converting the non None values of this field to compact codes and back, or None.
+
+        The codes are the values of choices if it is a dict, or the index of the value if it is a list or a tuple.
+        Both raise DictValueError on a value that is not in choices.
+        The values and the codes are looked up with their type, so that 1, 1.0 and True are not mixed up.
+        """
+        choices = self.choices
+        if isinstance(choices, dict):
+            codes = { (type(k), k) : v for k, v in choices.items() }
+            values = { (type(v), v) : k for k, v in choices.items() }
+        elif isinstance(choices, (list, tuple)):
+            codes = {}
+            try:
+                for ind, value in enumerate(choices):
+                    codes.setdefault((type(value), value), ind)
+            except TypeError:
+                return None
+            values = { (int, ind) : value for ind, value in enumerate(choices) }
+        else:
+            return None
+
+        def encode(value):
+            try:
+                return codes[(type(value), value)]
+            except (KeyError, TypeError):
+                raise DictValueError(message="Cannot encode {0!r}, it is not in choices".format(value))
+
+        def decode(code):
+            try:
+                return values[(type(code), code)]
+            except (KeyError, TypeError):
+                raise DictValueError(message="Cannot decode {0!r}, it is not a code of choices".format(code))
+        return encode, decode
+
+    def _codec(self):
+        codec = self.__dict__.get("_codec_cache", _MISSING)
+        if codec is _MISSING:
+            codec = self._codec_cache = self._compile_codec()
+        return codec
+
+    def encode_value(self, value):
+        """Returns the code of value, see _compile_codec. None and fields without codes return value unchanged."""
+        codec = self._codec()
+        return value if value is None or codec is None else codec[0](value)
+
+    def decode_value(self, code):
+        """Reverse of encode_value"""
+        codec = self._codec()
+        return code if code is None or codec is None else codec[1](code)
+
     def make_default(self):
         if self.default is None:
             return None
         if callable(self.default):
             return self.default(self)
         else:
-            return self.default
+            constant, factory = _compile_constant(self.default)
+            return constant if factory is None else factory()
+
+    def _compile_default(self):
+        """Returns (constant, factory) used by the default factory of DefinedDict.
+
+        If factory is None, constant is the default value, otherwise factory() returns the default value.
+        """
+        if not issubclass(_defined_in(type(self), "_compile_default"), _defined_in(type(self), "make_default")):
+            return None, self.make_default
+        if self.default is None:
+            return None, None
+        if callable(self.default):
+            return None, functools.partial(self.default, self)
+        return _compile_constant(self.default)
 
     def clean(self, document, key, set_default=True, **kwargs):
         if key not in document:
             if set_default:
                 document[key] = self.make_default()
 
+    def _cleaned(self, value, key, set_default=True, **kwargs):
+        """Non mutating version of clean, used by DefinedDict.clean_document(..., in_place=False).
+
+        value                   the value of key in the document, or _MISSING if the key is not in the document.
+
+        Returns the cleaned value, value itself if nothing changed, or _MISSING to leave the key out.
+        value is never modified, a value that needs changes is copied.
+        """
+        if not issubclass(_defined_in(type(self), "_cleaned"), _defined_in(type(self), "clean")):
+            # clean is overridden without a counterpart, clean a copy of the value.
+            scratch = {} if value is _MISSING else { key : copy.deepcopy(value) }
+            self.clean(scratch, key, set_default=set_default, **kwargs)
+            new = scratch.get(key, _MISSING)
+            return value if _same_value(value, new) else new
+        if value is _MISSING and set_default:
+            return self.make_default()
+        return value
+
+    def _clean_steps(self, document, key, **kwargs):
+        """Generator version of clean, yielding after each unit of work, see DefinedDict.aclean_document"""
+        self.clean(document, key, **kwargs)
+        yield
+
     def update(self, document, key, value):
         document[key] = value
 
+    def _update_changes(self, document, key, value, path, changes):
+        """Same as update, but also records the changes made in changes as { dotted path : new value }.
+
+        path                    the dotted path of key in the root document.
+        """
+        if not issubclass(_defined_in(type(self), "_update_changes"), _defined_in(type(self), "update")):
+            # update is overridden without a counterpart, compare the value before and after.
+            old = document.get(key, _MISSING)
+            self.update(document, key, value)
+            new = document.get(key, _MISSING)
+            if new is old and isinstance(new, (dict, list)):
+                changes[path] = new # may have been modified in place
+            else:
+                _record_change(changes, path, old, new)
+            return
+        _record_change(changes, path, document.get(key, _MISSING), value)
+        self.update(document, key, value)
+
 
 class TypedField(Field):
 
@@ -134,20 +540,134 @@ class TypedField(Field):
             else:
                 yield Field.ERROR_TYPE
 
+    def _compile_checks(self):
+        checks = super()._compile_checks()
+        allowed_type = self.allowed_type
+        def check_type(value, key, out):
+            if not isinstance(value, allowed_type):
+                out.append((key, Field.ERROR_TYPE, value))
+        checks.append(check_type)
+        return checks
+
+    def _compile_validators(self):
+        validators = super()._compile_validators()
+        allowed_type = self.allowed_type
+        def valid_type(value):
+            return isinstance(value, allowed_type)
+        validators.append(valid_type)
+        return validators
+
 
 class StringField(TypedField):
     """Typed Field for str
 
     Additional functionality for string field
 
-    regex               define a regex for this StringField
+    regex               define a regex for this StringField, the whole string needs to match it.
+    min_length          define the min length of the string (inclusive)
+    max_length          define the max length of the string (inclusive)
+    charset             define the characters allowed in the string, a str or an iterable of characters.
+
+    A string that breaks any of these produces a single ERROR_VALUE.
+    Patterns are compiled once and shared by all the fields using the same pattern.
     """
 
-    def __init__(self, regex=None, **kwargs):
+    def __init__(self, regex=None, min_length=None, max_length=None, charset=None, **kwargs):
         super().__init__(allowed_type=(str, ), **kwargs)
         if isinstance(regex, str):
-            regex = re.compile(regex)
+            regex = _compile_pattern(regex)
+        elif regex is not None:
+            regex = _compile_pattern(regex.pattern, regex.flags & ~re.UNICODE) # re.UNICODE is implied for str patterns
         self.regex = regex
+        self.min_length = min_length
+        self.max_length = max_length
+        if charset is not None and not isinstance(charset, str):
+            charset = "".join(sorted(set(charset)))
+        self.charset = charset
+
+    def _compile_string_check(self):
+        """Returns a function valid_string(value) checking the constraints of a str, or None if there are none"""
+        fullmatch = self.regex.fullmatch if self.regex is not None else None
+        min_length, max_length, charset = self.min_length, self.max_length, self.charset
+        if fullmatch is None and min_length is None and max_length is None and charset is None:
+            return None
+        def valid_string(value):
+            if min_length is not None and len(value) < min_length:
+                return False
+            if max_length is not None and len(value) > max_length:
+                return False
+            if charset is not None and value.strip(charset):
+                return False
+            return fullmatch is None or fullmatch(value) is not None
+        return valid_string
+
+    def _build_caches(self):
+        self._string_check()
+        super()._build_caches()
+
+    def _string_check(self):
+        """The cached result of _compile_string_check"""
+        valid_string = self.__dict__.get("_string_check_cache", _MISSING)
+        if valid_string is _MISSING:
+            valid_string = self._string_check_cache = self._compile_string_check()
+        return valid_string
+
+    def errors(self, value, with_key=None):
+        yield from super().errors(value, with_key)
+        if isinstance(value, str):
+            valid_string = self._string_check()
+            if valid_string is not None and not valid_string(value):
+                if with_key is not None:
+                    yield (with_key, Field.ERROR_VALUE, value)
+                else:
+                    yield Field.ERROR_VALUE
+
+    def _compile_checks(self):
+        checks = super()._compile_checks()
+        valid_string = self._compile_string_check()
+        if valid_string is not None:
+            def check_string(value, key, out):
+                if isinstance(value, str) and not valid_string(value):
+                    out.append((key, Field.ERROR_VALUE, value))
+            checks.append(check_string)
+        return checks
+
+    def _compile_validators(self):
+        validators = super()._compile_validators()
+        valid_string = self._compile_string_check()
+        if valid_string is not None:
+            validators.append(valid_string) # runs after valid_type, so value is a str
+        return validators
+
+    def _compile_batch_validator(self):
+        cls = type(self)
+        if _defined_in(cls, "errors") is not StringField or _defined_in(cls, "_compile_checks") is not StringField:
+            return None
+        allowed_types = { str } if self.is_required else { str, type(None) }
+        choices = self._choices_lookup() if self.choices is not None else None
+        fullmatch = self.regex.fullmatch if self.regex is not None else None
+        min_length, max_length, charset = self.min_length, self.max_length, self.charset
+
+        def valid_all(values):
+            if not values:
+                return True
+            types = set(map(type, values))
+            if not types <= allowed_types:
+                return False
+            if type(None) in types:
+                values = [ v for v in values if v is not None ]
+                if not values:
+                    return True
+            if choices is not None and not all(map(choices.__contains__, values)):
+                return False
+            if min_length is not None and min(map(len, values)) < min_length:
+                return False
+            if max_length is not None and max(map(len, values)) > max_length:
+                return False
+            if charset is not None and "".join(values).strip(charset):
+                return False
+            return fullmatch is None or all(map(fullmatch, values))
+        return valid_all
 
 
 class NumberField(TypedField):
@@ -179,6 +699,25 @@ class NumberField(TypedField):
                 else:
                     yield Field.ERROR_VALUE
 
+    def _compile_checks(self):
+        checks = super()._compile_checks()
+        if self.min is not None or self.max is not None:
+            min_value, max_value = self.min, self.max
+            def check_range(value, key, out):
+                if (min_value is not None and value < min_value) or (max_value is not None and value >= max_value):
+                    out.append((key, Field.ERROR_VALUE, value))
+            checks.append(check_range)
+        return checks
+
+    def _compile_validators(self):
+        validators = super()._compile_validators()
+        if self.min is not None or self.max is not None:
+            min_value, max_value = self.min, self.max
+            def valid_range(value):
+                return not ((min_value is not None and value < min_value) or (max_value is not None and value >= max_value))
+            validators.append(valid_range)
+        return validators
+
 
 class IntField(NumberField):
     """TypedField for int
@@ -200,6 +739,11 @@ class FloatField(NumberField):
             value = float(value)
         super().update(document, key, value)
 
+    def _update_changes(self, document, key, value, path, changes):
+        if isinstance(value, int):
+            value = float(value)
+        super()._update_changes(document, key, value, path, changes)
+
 
 class BoolField(TypedField):
     """TypedField for boolean
@@ -238,13 +782,93 @@ class ListField(TypedField):
                 for inner in value:
                     yield from self.inner_type.errors(inner, None)
 
+    def _compile_checks(self):
+        checks = super()._compile_checks()
+        if self.inner_type is not None:
+            inner_check = self.inner_type.compile_errors()
+            valid_all = self.inner_type._compile_batch_validator()
+            def check_inner(value, key, out):
+                if isinstance(value, list):
+                    if valid_all is not None and valid_all(value):
+                        return
+                    for ind, inner in enumerate(value):
+                        inner_check(inner, key + "." + str(ind), out)
+            checks.append(check_inner)
+        return checks
+
+    def _compile_validators(self):
+        validators = super()._compile_validators()
+        if self.inner_type is not None:
+            inner_valid = self.inner_type.compile_validator()
+            valid_all = self.inner_type._compile_batch_validator()
+            def valid_inner(value):
+                if isinstance(value, list):
+                    if valid_all is not None and valid_all(value):
+                        return True
+                    for inner in value:
+                        if not inner_valid(inner):
+                            return False
+                return True
+            validators.append(valid_inner)
+        return validators
+
+    def _revalidate(self, value, key, rest, out, rechecked):
+        if rest and self.inner_type is not None and isinstance(value, list) and rest[0].isdigit():
+            index = int(rest[0])
+            inner_key = key + "." + rest[0]
+            if index < len(value):
+                self.inner_type._revalidate(value[index], inner_key, rest[1:], out, rechecked)
+            else:
+                rechecked.append(inner_key)
+        else:
+            super()._revalidate(value, key, rest, out, rechecked)
+
+    def _build_caches(self):
+        if self.inner_type is not None:
+            self.inner_type._build_caches()
+        self._outer_checks(ListField)
+        super()._build_caches()
+
+    def _error_steps(self, value, key, out):
+        checks = self._outer_checks(ListField) if self.inner_type is not None and isinstance(value, list) else None
+        if checks is None:
+            yield from super()._error_steps(value, key, out)
+            return
+        for check in checks:
+            check(value, key, out)
+        inner_steps = self.inner_type._error_steps
+        for ind, inner in enumerate(value):
+            yield from inner_steps(inner, key + "." + str(ind), out)
+
+    def _compile_codec(self):
+        codec = self.inner_type._codec() if self.inner_type is not None else None
+        if codec is None:
+            return None
+        def convert_list(convert):
+            def convert_values(value):
+                if not isinstance(value, list):
+                    return value
+                return [ None if v is None else convert(v) for v in value ]
+            return convert_values
+        return convert_list(codec[0]), convert_list(codec[1])
+
     def clean(self, document, key, **kwargs):
         super().clean(document, key, **kwargs)
-        if self.ensure_list and document.get(key) is None:
+        value = document.get(key)
+        if self.ensure_list and value is None:
             document[key] = []
-        if (self.remove_none_value and document.get(key) is not None and
-                isinstance(document.get(key), list)):
-            document[key] = [ item for item in document.get(key) if item is not None ]
+        elif self.remove_none_value and isinstance(value, list) and None in value:
+            document[key] = [ item for item in value if item is not None ]
+
+    def _cleaned(self, value, key, **kwargs):
+        if _defined_in(type(self), "clean") is not ListField:
+            return super()._cleaned(value, key, **kwargs)
+        value = super()._cleaned(value, key, **kwargs)
+        if self.ensure_list and (value is None or value is _MISSING):
+            return []
+        if self.remove_none_value and isinstance(value, list) and None in value:
+            return [ item for item in value if item is not None ]
+        return value
 
 class DateTimeField(Field):
     """Field used to store datetime object.
@@ -261,6 +885,21 @@ class DateTimeField(Field):
             else:
                 yield Field.ERROR_TYPE
 
+    def _compile_checks(self):
+        checks = super()._compile_checks()
+        def check_type(value, key, out):
+            if not isinstance(value, (datetime.datetime, )):
+                out.append((key, Field.ERROR_TYPE, value))
+        checks.append(check_type)
+        return checks
+
+    def _compile_validators(self):
+        validators = super()._compile_validators()
+        def valid_type(value):
+            return isinstance(value, (datetime.datetime, ))
+        validators.append(valid_type)
+        return validators
+
 
 class DictField(TypedField):
     """Abstract class for Dict
@@ -279,6 +918,16 @@ class DictField(TypedField):
             elif isinstance(document.get(key), dict):
                 document[key].update(value)
 
+    def _update_changes(self, document, key, value, path, changes):
+        if isinstance(value, dict):
+            current = document.get(key)
+            if current is None:
+                _record_change(changes, path, _MISSING, value)
+            elif isinstance(current, dict):
+                for k, v in value.items():
+                    _record_change(changes, "{0}.{1}".format(path, k), current.get(k, _MISSING), v)
+        self.update(document, key, value)
+
 
 class MapField(DictField):
 
@@ -295,9 +944,69 @@ class MapField(DictField):
                 for k, v in value.items():
                     yield from self.inner_type.errors(v, ".".join([with_key, k]))
             else:
-                for k, v in value:
+                for v in value.values():
                     yield from self.inner_type.errors(v, None)
 
+    def _compile_checks(self):
+        checks = super()._compile_checks()
+        inner_check = self.inner_type.compile_errors()
+        def check_inner(value, key, out):
+            if isinstance(value, dict):
+                for k, v in value.items():
+                    inner_check(v, ".".join([key, k]), out)
+        checks.append(check_inner)
+        return checks
+
+    def _compile_validators(self):
+        validators = super()._compile_validators()
+        inner_valid = self.inner_type.compile_validator()
+        def valid_inner(value):
+            if isinstance(value, dict):
+                for v in value.values():
+                    if not inner_valid(v):
+                        return False
+            return True
+        validators.append(valid_inner)
+        return validators
+
+    def _revalidate(self, value, key, rest, out, rechecked):
+        if rest and isinstance(value, dict):
+            inner_key = ".".join([key, rest[0]])
+            if rest[0] in value:
+                self.inner_type._revalidate(value[rest[0]], inner_key, rest[1:], out, rechecked)
+            else:
+                rechecked.append(inner_key)
+        else:
+            super()._revalidate(value, key, rest, out, rechecked)
+
+    def _build_caches(self):
+        self.inner_type._build_caches()
+        self._outer_checks(MapField)
+        super()._build_caches()
+
+    def _error_steps(self, value, key, out):
+        checks = self._outer_checks(MapField) if isinstance(value, dict) else None
+        if checks is None:
+            yield from super()._error_steps(value, key, out)
+            return
+        for check in checks:
+            check(value, key, out)
+        inner_steps = self.inner_type._error_steps
+        for k, v in value.items():
+            yield from inner_steps(v, ".".join([key, k]), out)
+
+    def _compile_codec(self):
+        codec = self.inner_type._codec()
+        if codec is None:
+            return None
+        def convert_map(convert):
+            def convert_values(value):
+                if not isinstance(value, dict):
+                    return value
+                return { k : None if v is None else convert(v) for k, v in value.items() }
+            return convert_values
+        return convert_map(codec[0]), convert_map(codec[1])
+
     def update(self, document, key, value):
         if isinstance(value, dict):
             if document.get(key) is None:
@@ -316,6 +1025,24 @@ class MapField(DictField):
                     else:
                         self.inner_type.update(document[key], k, v)
 
+    def _update_changes(self, document, key, value, path, changes):
+        if not isinstance(value, dict):
+            return
+        if document.get(key) is None:
+            self.update(document, key, value)
+            _record_change(changes, path, _MISSING, document[key])
+            return
+        current = document[key]
+        for k, v in value.items():
+            inner_path = "{0}.{1}".format(path, k)
+            if current.get(k) is None:
+                _record_change(changes, inner_path, current.get(k, _MISSING), v)
+                current[k] = v
+            elif isinstance(self.inner_type, DefinedDictField):
+                self.inner_type.model._update_changes(current[k], v, inner_path, changes)
+            else:
+                self.inner_type._update_changes(current, k, v, inner_path, changes)
+
 
 class DefinedDictField(DictField):
 
@@ -330,12 +1057,65 @@ class DefinedDictField(DictField):
         if isinstance(value, dict):
             yield from self.model._yield_errors(value, parent=with_key)
 
+    def _compile_checks(self):
+        checks = super()._compile_checks()
+        model = self.model
+        def check_model(value, key, out):
+            if isinstance(value, dict):
+                model._collect_errors(value, key, out)
+        checks.append(check_model)
+        return checks
+
+    def _compile_validators(self):
+        validators = super()._compile_validators()
+        model = self.model
+        def valid_model(value):
+            return not isinstance(value, dict) or model._is_valid(value)
+        validators.append(valid_model)
+        return validators
+
+    def _revalidate(self, value, key, rest, out, rechecked):
+        if rest and isinstance(value, dict) and not self.model._custom_errors:
+            self.model._revalidate(value, rest, key, out, rechecked)
+        else:
+            super()._revalidate(value, key, rest, out, rechecked)
+
+    def _build_caches(self):
+        self._outer_checks(DefinedDictField)
+        super()._build_caches()
+
+    def _error_steps(self, value, key, out):
+        checks = self._outer_checks(DefinedDictField) if isinstance(value, dict) else None
+        if checks is None:
+            yield from super()._error_steps(value, key, out)
+            return
+        for check in checks:
+            check(value, key, out)
+        yield from self.model._error_steps(value, key, out)
+
+    def _compile_codec(self):
+        codec = self.model._document_codec()
+        if codec is None:
+            return None
+        def convert_model(convert):
+            def convert_document(value):
+                return convert(value) if isinstance(value, dict) else value
+            return convert_document
+        return convert_model(codec[0]), convert_model(codec[1])
+
     def make_default(self):
         if self.default is None:
             return self.model.make_default()
         else:
             return super().make_default()
 
+    def _compile_default(self):
+        if self.default is None and _defined_in(type(self), "make_default") is DefinedDictField:
+            if _defined_in(self.model, "make_default") is DefinedDict:
+                return None, self.model._default_factory # inline the factory of the model
+            return None, self.model.make_default
+        return super()._compile_default()
+
     def update(self, document, key, value):
         if isinstance(value, dict):
             if document.get(key) is None:
@@ -343,6 +1123,14 @@ class DefinedDictField(DictField):
             else:
                 self.model.update(document[key], value)
 
+    def _update_changes(self, document, key, value, path, changes):
+        if isinstance(value, dict):
+            if document.get(key) is None:
+                _record_change(changes, path, document.get(key, _MISSING), value)
+                document[key] = value
+            else:
+                self.model._update_changes(document[key], value, path, changes)
+
     def clean(self, document, key, set_default=True, **kwargs):
         if key not in document:
             if set_default:
@@ -350,6 +1138,27 @@ class DefinedDictField(DictField):
         if document.get(key) is not None:
             self.model.clean_document(document[key], set_default=set_default, **kwargs)
 
+    def _cleaned(self, value, key, set_default=True, **kwargs):
+        if _defined_in(type(self), "clean") is not DefinedDictField:
+            return super()._cleaned(value, key, set_default=set_default, **kwargs)
+        if value is _MISSING:
+            if not set_default:
+                return value
+            value = self.make_default()
+        if isinstance(value, dict):
+            return self.model._clean_copy(value, set_default=set_default, **kwargs)
+        return value
+
+    def _clean_steps(self, document, key, set_default=True, **kwargs):
+        if _defined_in(type(self), "clean") is not DefinedDictField:
+            yield from super()._clean_steps(document, key, set_default=set_default, **kwargs)
+            return
+        if key not in document:
+            if set_default:
+                document[key] = self.make_default()
+        if document.get(key) is not None:
+            yield from self.model._clean_steps(document[key], set_default=set_default, **kwargs)
+
 #################################### Mixin ####################################
 class Mixin(object):
     """Parent class for mixins
@@ -377,22 +1186,86 @@ class DefinedDictMetaClass(type):
 
     def __init__(cls, name, bases, cdict):
         super().__init__(name, bases, cdict)
-        cls._fields = {}
-        cls._mixins = []
+        fields = {}
+        mixins = []
         # stores all fields in _fields
         for base in bases:
             if hasattr(base, "_fields"):
-                cls._fields.update(base._fields)
-        cls._fields.update({ k : v for k, v in cdict.items() if isinstance(v, Field) })
+                fields.update(base._fields)
+        fields.update({ k : v for k, v in cdict.items() if isinstance(v, Field) })
+        cls._fields = types.MappingProxyType(fields)
+        cls._mixins = ()
         # stores all mixin in _mixins, and also retrieve all mixin from parent.
         for base in bases:
             if issubclass(base, Mixin):
                 base._apply_mixin(cls, name, bases, cdict)
-                cls._mixins.append(base)
+                mixins.append(base)
             if hasattr(base, "_mixins"):
                 for m in base._mixins:
                     m._apply_mixin(cls, name, bases, cdict)
-                    cls._mixins.append(m)
+                    mixins.append(m)
+        cls._mixins = tuple(mixins)
+        # compile the validation plan once all the fields and mixins are applied.
+        cls._error_plan = tuple((key, ) + definition._compile_plan() for key, definition in cls._fields.items())
+        cls._valid_plan = tuple((key, ) + definition._compile_validity() for key, definition in cls._fields.items())
+        cls._default_factory = staticmethod(cls._compile_default_factory())
+        # the fields may be shared with other models, their caches are built here rather than on first use.
+        for definition in cls._fields.values():
+            definition._build_caches()
+        cls._document_codec()
+        # a model that overrides _yield_errors is validated through it instead of the compiled plans.
+        # (globals has no DefinedDict while DefinedDict itself is being created)
+        cls._custom_errors = _defined_in(cls, "_yield_errors") is not globals().get("DefinedDict", cls)
+        # the ValidationCache of this model and of the models containing it, notified of the documents changed by update,
+        # see dd_cache.
+        cls._validation_caches = weakref.WeakSet()
+
+    def _compile_default_factory(cls):
+        """Returns a function that creates the default document of cls.
+
+        Constant defaults are stored in a template that is copied, the other defaults are called in field order.
+        """
+        template = {}
+        factories = []
+        for key, definition in cls._fields.items():
+            constant, factory = definition._compile_default()
+            template[key] = constant
+            if factory is not None:
+                factories.append((key, factory))
+        factories = tuple(factories)
+        if not factories:
+            return template.copy
+
+        def make_default():
+            document = template.copy()
+            for key, factory in factories:
+                document[key] = factory()
+            return document
+        return make_default
+
+
+ASYNC_COOPERATIVE = "cooperative"
+ASYNC_EXECUTOR = "executor"
+
+
+async def _drive(steps, yield_every, count=0):
+    """Run the generator steps, giving control back to the event loop every yield_every steps.
+
+    Returns the number of steps run since the last time control was given back.
+    """
+    for _ in steps:
+        count += 1
+        if count >= yield_every:
+            count = 0
+            await asyncio.sleep(0)
+    return count
+
+
+def _check_async_mode(mode, yield_every):
+    if mode not in (ASYNC_COOPERATIVE, ASYNC_EXECUTOR):
+        raise DictValueError(message="Invalid async mode : {0}".format(mode))
+    if yield_every < 1:
+        raise DictValueError(message="Invalid value for yield_every : {0}".format(yield_every))
 
 
 class DefinedDict(object, metaclass=DefinedDictMetaClass):
@@ -407,41 +1280,595 @@ class DefinedDict(object, metaclass=DefinedDictMetaClass):
             value = document.get(key)
             yield from definition.errors(value, with_key=key_string)
 
+    @classmethod
+    def _collect_errors(cls, document, parent, out):
+        """Run the compiled validation plan on document, appending the errors to out.
+
+        This produces the same errors, in the same order, as _yield_errors.
+        """
+        if cls._custom_errors:
+            out.extend(cls._yield_errors(document, parent=parent))
+            return
+        get = document.get
+        if parent is None:
+            for key, on_none, checks in cls._error_plan:
+                value = get(key)
+                if value is None:
+                    if on_none is not None:
+                        on_none(value, key, out)
+                else:
+                    for check in checks:
+                        check(value, key, out)
+        else:
+            parent = parent + "."
+            for key, on_none, checks in cls._error_plan:
+                value = get(key)
+                if value is None:
+                    if on_none is not None:
+                        on_none(value, parent + key, out)
+                else:
+                    key_string = parent + key
+                    for check in checks:
+                        check(value, key_string, out)
+
     @classmethod
     def get_document_errors(cls, document):
-        return list(cls._yield_errors(document))
+        out = []
+        cls._collect_errors(document, None, out)
+        return out
 
     @classmethod
-    def is_document_valid(cls, document):
-        try:
-            next(cls._yield_errors(document))
-            return False
-        except StopIteration:
+    def _error_steps(cls, document, parent, out):
+        if cls._custom_errors:
+            cls._collect_errors(document, parent, out)
+            yield
+            return
+        get = document.get
+        prefix = "" if parent is None else parent + "."
+        fields = cls._fields
+        for key, on_none, checks in cls._error_plan:
+            value = get(key)
+            definition = fields[key]
+            if value is None or type(definition)._error_steps is Field._error_steps:
+                # checked in one step, the same way as _collect_errors
+                if value is None:
+                    if on_none is not None:
+                        on_none(value, prefix + key, out)
+                else:
+                    for check in checks:
+                        check(value, prefix + key, out)
+                yield
+            else:
+                yield from definition._error_steps(value, prefix + key, out)
+
+    @classmethod
+    async def aget_document_errors(cls, document, mode=ASYNC_COOPERATIVE, yield_every=1000, executor=None):
+        """Async version of get_document_errors, that does not block the event loop on large documents.
+
+        mode                    ASYNC_COOPERATIVE : the checks run on the event loop, which is given control back
+                                every yield_every fields/list elements/map values.
+                                ASYNC_EXECUTOR : get_document_errors runs in executor, or in the default executor
+                                of the loop (a bounded thread pool) if executor is None.
+
+        Returns the same errors as get_document_errors. The document should not be modified until this is done.
+        """
+        _check_async_mode(mode, yield_every)
+        if mode == ASYNC_EXECUTOR:
+            return await asyncio.get_running_loop().run_in_executor(executor, cls.get_document_errors, document)
+        out = []
+        await _drive(cls._error_steps(document, None, out), yield_every)
+        return out
+
+    @classmethod
+    def _is_valid(cls, document):
+        """Run the fail fast plan on document.
+
+        Stops at the first failure, no keys or error tuples are built.
+        A model that overrides _yield_errors stops at the first error it yields instead.
+        """
+        if cls._custom_errors:
+            for _ in cls._yield_errors(document):
+                return False
             return True
+        get = document.get
+        for key, on_none, validators in cls._valid_plan:
+            value = get(key)
+            if value is None:
+                if on_none is not None and not on_none(value):
+                    return False
+            else:
+                for valid in validators:
+                    if not valid(value):
+                        return False
+        return True
+
+    @classmethod
+    def is_document_valid(cls, document):
+        return cls._is_valid(document)
+
+    @classmethod
+    def revalidate_document(cls, document, errors, changed):
+        """Re-check only the parts of document that changed, and merge the result with its previous errors.
+
+        errors                  the errors of document before the changes, i.e. from get_document_errors.
+        changed                 the dotted paths that changed, or the delta returned by update(..., with_delta=True).
+
+        Each changed path is followed down the fields (DefinedDictField, and the index/key of ListField/MapField)
+        and the field it ends at is re-checked along with everything under it. The errors of the re-checked keys are
+        replaced, and the others are kept. The result contains the same errors as get_document_errors, but the
+        re-checked errors are placed at the end instead of in field order.
+        """
+        if cls._custom_errors:
+            return cls.get_document_errors(document)
+        if isinstance(changed, dict):
+            changed = list(changed.get("$set", ())) + list(changed.get("$unset", ()))
+        selected = []
+        for path in sorted(set(tuple(p.split(".")) for p in changed), key=len):
+            if not any(path[:len(s)] == s for s in selected):
+                selected.append(path)
+
+        out = []
+        rechecked = []
+        for path in selected:
+            cls._revalidate(document, path, None, out, rechecked)
+        if not rechecked:
+            return list(errors)
+        rechecked_keys = set(rechecked)
+        prefixes = tuple(key + "." for key in rechecked)
+        return [ e for e in errors if not (e[0] in rechecked_keys or e[0].startswith(prefixes)) ] + out
+
+    @classmethod
+    def _revalidate(cls, document, path, parent, out, rechecked):
+        definition = cls._fields.get(path[0])
+        if definition is not None:
+            key_string = path[0] if parent is None else ".".join([parent, path[0]])
+            definition._revalidate(document.get(path[0]), key_string, path[1:], out, rechecked)
+
+    @classmethod
+    def _iter_batches(cls, documents, batch_size):
+        iterator = iter(documents)
+        while True:
+            batch = list(itertools.islice(iterator, batch_size))
+            if not batch:
+                return
+            yield batch
+
+    @classmethod
+    def validate_many(cls, documents, batch_size=1000):
+        """Validate an iterable of documents, yielding (index, errors) for each document in order.
+
+        documents               any iterable of documents, it is consumed lazily.
+        batch_size              the number of documents held in memory at a time.
+
+        Each field is checked across the whole batch before moving on to the next field.
+        The errors of each document are the same as get_document_errors.
+        """
+        index = 0
+        if cls._custom_errors or _defined_in(cls, "get_document_errors") is not DefinedDict:
+            for document in documents:
+                yield index, cls.get_document_errors(document)
+                index += 1
+            return
+        plan = cls._error_plan
+        for batch in cls._iter_batches(documents, batch_size):
+            outs = [ [] for _ in batch ]
+            for key, on_none, checks in plan:
+                for document, out in zip(batch, outs):
+                    value = document.get(key)
+                    if value is None:
+                        if on_none is not None:
+                            on_none(value, key, out)
+                    else:
+                        for check in checks:
+                            check(value, key, out)
+            for out in outs:
+                yield index, out
+                index += 1
+
+    @classmethod
+    def _validate_batch(cls, batch):
+        return [ errors for _, errors in cls.validate_many(batch, batch_size=len(batch)) ]
+
+    @classmethod
+    async def avalidate_many(cls, documents, batch_size=1000, mode=ASYNC_COOPERATIVE, yield_every=1000, executor=None):
+        """Async version of validate_many, an async generator of (index, errors).
+
+        In ASYNC_EXECUTOR mode, each batch of batch_size documents is validated in executor.
+        See aget_document_errors for mode, yield_every and executor.
+        """
+        _check_async_mode(mode, yield_every)
+        index = 0
+        if mode == ASYNC_EXECUTOR:
+            loop = asyncio.get_running_loop()
+            for batch in cls._iter_batches(documents, batch_size):
+                for errors in await loop.run_in_executor(executor, cls._validate_batch, batch):
+                    yield index, errors
+                    index += 1
+        else:
+            count = 0
+            for document in documents:
+                out = []
+                count = await _drive(cls._error_steps(document, None, out), yield_every, count)
+                yield index, out
+                index += 1
+
+    @classmethod
+    def clean_many(cls, documents, set_default=True, remove_undefined=True, batch_size=1000):
+        """Clean an iterable of documents, yielding (index, document) for each document in order.
+
+        See validate_many and clean_document.
+        """
+        index = 0
+        if _defined_in(cls, "clean_document") is not DefinedDict:
+            for document in documents:
+                yield index, cls.clean_document(document, set_default=set_default, remove_undefined=remove_undefined)
+                index += 1
+            return
+        fields = cls._fields
+        for batch in cls._iter_batches(documents, batch_size):
+            present = [ document for document in batch if document is not None ]
+            for key, definition in fields.items():
+                clean = definition.clean
+                for document in present:
+                    clean(document, key, set_default=set_default, remove_undefined=remove_undefined)
+            if remove_undefined:
+                for document in present:
+                    for key in [ k for k in document if k not in fields ]:
+                        document.pop(key)
+            for document in batch:
+                yield index, document
+                index += 1
+
+    @classmethod
+    def _document_codec(cls):
+        """Returns (encode, decode) of the documents of this model, or None if no field has codes.
+
+        Generated on the first call, see Field._compile_codec.
+        """
+        if "_codec" not in cls.__dict__:
+            encoders = []
+            decoders = []
+            for key, definition in cls._fields.items():
+                codec = definition._codec()
+                if codec is not None:
+                    encoders.append((key, codec[0]))
+                    decoders.append((key, codec[1]))
+
+            def convert_fields(converters):
+                def convert_document(document):
+                    output = dict(document)
+                    for key, convert in converters:
+                        value = output.get(key)
+                        if value is not None:
+                            output[key] = convert(value)
+                    return output
+                return convert_document
+            cls._codec = (convert_fields(tuple(encoders)), convert_fields(tuple(decoders))) if encoders else None
+        return cls._codec
+
+    @classmethod
+    def encode_document(cls, document):
+        """Returns a copy of document with the values of the fields with choices replaced by their codes.
+
+        The codes are the values of choices if it is a dict, or the index of the value if it is a list or a tuple.
+        Nested DefinedDictField, ListField and MapField are encoded as well, the other values are shared with document.
+        Raises DictValueError if a value is not in choices.
+        """
+        codec = cls._document_codec()
+        return dict(document) if codec is None else codec[0](document)
+
+    @classmethod
+    def decode_document(cls, document):
+        """Reverse of encode_document"""
+        codec = cls._document_codec()
+        return dict(document) if codec is None else codec[1](document)
+
+    @classmethod
+    def encode_many(cls, documents):
+        """Returns the list of encode_document of each document"""
+        codec = cls._document_codec()
+        if codec is None:
+            return [ dict(document) for document in documents ]
+        encode = codec[0]
+        return [ encode(document) for document in documents ]
+
+    @classmethod
+    def decode_many(cls, documents):
+        """Returns the list of decode_document of each document"""
+        codec = cls._document_codec()
+        if codec is None:
+            return [ dict(document) for document in documents ]
+        decode = codec[1]
+        return [ decode(document) for document in documents ]
+
+    @classmethod
+    def record_class(cls):
+        """Returns the Record class of this model, generating it on the first call.
+
+        See Record.
+        """
+        record_class = cls.__dict__.get("_record_class")
+        if record_class is None:
+            record_class = cls._record_class = Record._make_class(cls)
+        return record_class
 
     @classmethod
     def make_default(cls):
-        return { key : definition.make_default() for key, definition in cls._fields.items() }
+        return cls._default_factory()
 
     @classmethod
-    def clean_document(cls, document, set_default=True, remove_undefined=True):
+    def clean_document(cls, document, set_default=True, remove_undefined=True, in_place=True):
+        """
+        in_place                if False, document is not modified. A new document is returned, that shares all the
+                                values that did not change with document, and only the dictionaries and lists that
+                                changed are copied. If nothing changed, document itself is returned.
+        """
         if document is None:
             return document
-        for key, definition in cls._fields.items():
+        if not in_place:
+            return cls._clean_copy(document, set_default=set_default, remove_undefined=remove_undefined)
+        return cls._clean_in_place(document, set_default=set_default, remove_undefined=remove_undefined)
+
+    @classmethod
+    def _clean_in_place(cls, document, set_default=True, remove_undefined=True):
+        fields = cls._fields
+        for key, definition in fields.items():
             definition.clean(document, key, set_default=set_default, remove_undefined=remove_undefined)
 
         if remove_undefined:
-            for key in set(document.keys()) - set(cls._fields.keys()) : # remove all the undefined keys
+            for key in [ k for k in document if k not in fields ]: # remove all the undefined keys
                 document.pop(key)
         return document
 
     @classmethod
-    def update(cls, document, new_value):
+    def _clean_copy(cls, document, set_default=True, remove_undefined=True):
+        """clean_document(..., in_place=False), document is copied on the first change"""
+        if _defined_in(cls, "clean_document") is not DefinedDict:
+            cleaned = cls.clean_document(copy.deepcopy(document), set_default=set_default, remove_undefined=remove_undefined)
+            return document if _same_value(document, cleaned) else cleaned
+        output = None
+        fields = cls._fields
+        get = document.get
+        for key, definition in fields.items():
+            value = get(key, _MISSING)
+            new = definition._cleaned(value, key, set_default=set_default, remove_undefined=remove_undefined)
+            if new is not value:
+                if output is None:
+                    output = dict(document)
+                if new is _MISSING:
+                    output.pop(key, None)
+                else:
+                    output[key] = new
+
+        if remove_undefined:
+            undefined = [ k for k in document if k not in fields ]
+            if undefined:
+                if output is None:
+                    output = dict(document)
+                for key in undefined:
+                    output.pop(key)
+        return document if output is None else output
+
+    @classmethod
+    def _clean_steps(cls, document, set_default=True, remove_undefined=True):
+        if _defined_in(cls, "clean_document") is not DefinedDict:
+            cls.clean_document(document, set_default=set_default, remove_undefined=remove_undefined)
+            yield
+            return
+        if document is None:
+            return
+        for key, definition in cls._fields.items():
+            yield from definition._clean_steps(document, key, set_default=set_default, remove_undefined=remove_undefined)
+
+        if remove_undefined:
+            fields = cls._fields
+            for key in [ k for k in document if k not in fields ]: # remove all the undefined keys
+                document.pop(key)
+
+    @classmethod
+    async def aclean_document(cls, document, set_default=True, remove_undefined=True,
+                              mode=ASYNC_COOPERATIVE, yield_every=1000, executor=None):
+        """Async version of clean_document, see aget_document_errors for mode, yield_every and executor.
+
+        Use the returned document, as a ProcessPoolExecutor cleans a copy of document.
+        """
+        _check_async_mode(mode, yield_every)
+        if mode == ASYNC_EXECUTOR:
+            clean = functools.partial(cls.clean_document, document, set_default=set_default, remove_undefined=remove_undefined)
+            return await asyncio.get_running_loop().run_in_executor(executor, clean)
+        await _drive(cls._clean_steps(document, set_default=set_default, remove_undefined=remove_undefined), yield_every)
+        return document
+
+    @classmethod
+    def _document_updated(cls, document):
+        if cls._validation_caches:
+            for cache in list(cls._validation_caches):
+                cache.document_updated(document)
+
+    @classmethod
+    def update(cls, document, new_value, with_delta=False):
         """
         Recursively update the dictionary
+
+        with_delta              if True, returns the changes made to document as
+                                { "$set" : { dotted path : new value }, "$unset" : { dotted path : True } }
+                                Only the operators with changes are included, so an update that changes nothing returns {}.
+                                Setting a value to None is an unset, as None and missing keys are treated the same.
         """
+        if with_delta:
+            changes = {}
+            cls._update_changes(document, new_value, None, changes)
+            delta = {}
+            for path, value in changes.items():
+                if value is None:
+                    delta.setdefault("$unset", {})[path] = True
+                else:
+                    delta.setdefault("$set", {})[path] = value
+            return delta
+
         for key, value in new_value.items():
             if key in cls._fields:
                 definition = cls._fields.get(key)
                 definition.update(document, key, value)
+        cls._document_updated(document)
+
+    @classmethod
+    def _update_changes(cls, document, new_value, parent, changes):
+        for key, value in new_value.items():
+            if key in cls._fields:
+                path = key if parent is None else "{0}.{1}".format(parent, key)
+                cls._fields[key]._update_changes(document, key, value, path, changes)
+        cls._document_updated(document)
+
+#################################### Records ####################################
+class _RecordView(collections.abc.MutableMapping):
+    """Dict like view of a Record, allowing Field.clean to work directly on the attributes"""
+
+    __slots__ = ("record", )
+
+    def __init__(self, record):
+        self.record = record
+
+    def __getitem__(self, key):
+        record = self.record
+        bit = record._bits.get(key)
+        if bit is None or record._missing & bit:
+            raise KeyError(key)
+        return getattr(record, key)
+
+    def __setitem__(self, key, value):
+        record = self.record
+        bit = record._bits.get(key)
+        if bit is None:
+            raise KeyError(key)
+        setattr(record, key, value)
+        record._missing &= ~bit
+
+    def __delitem__(self, key):
+        record = self.record
+        self[key]
+        setattr(record, key, None)
+        record._missing |= record._bits[key]
+
+    def __iter__(self):
+        record = self.record
+        return (key for key, bit in record._bits.items() if not record._missing & bit)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class Record(object):
+    """Compact __slots__ based storage for the documents of a model, see DefinedDict.record_class
+
+    The record class has a slot for each field of the model, in the order of _fields.
+    Missing keys read as None, and are remembered so that to_dict does not add them back.
+    Keys that are not fields are not stored. Values are stored as they are, so a DefinedDictField value is still a dict.
+
+        UserRecord = User.record_class()
+        record = UserRecord.from_dict(document)
+        record.name
+        record.get_errors() == User.get_document_errors(document)
+    """
+
+    __slots__ = ("_missing", )
+    _model = None
+    _bits = {}
+
+    RESERVED = ("from_dict", "to_dict", "get_errors", "is_valid", "clean", "RESERVED",
+                "_missing", "_model", "_bits", "_values", "_load", "_make_class")
 
+    def __init__(self, **kwargs):
+        unknown = [ key for key in kwargs if key not in self._bits ]
+        if unknown:
+            raise TypeError("Unknown fields for {0} : {1}".format(type(self).__name__, ", ".join(unknown)))
+        self._load(kwargs)
+
+    @classmethod
+    def _make_class(cls, model):
+        keys = tuple(model._fields.keys())
+        for key in keys:
+            # names starting with __ would be mangled in __slots__, and the slots need to be identifiers
+            if key in cls.RESERVED or key.startswith("__") or not key.isidentifier() or keyword.iskeyword(key):
+                raise DictFieldError(message="Field {0} of {1} cannot be used in a Record".format(key, model.__name__))
+        if len(keys) == 1:
+            key = keys[0]
+            values = lambda record: (getattr(record, key), )
+        elif keys:
+            values = operator.attrgetter(*keys)
+        else:
+            values = lambda record: ()
+        cdict = {
+            "__slots__" : keys,
+            "_model" : model,
+            "_bits" : { key : 1 << ind for ind, key in enumerate(keys) },
+            "_values" : staticmethod(values),
+        }
+        return type("{0}Record".format(model.__name__), (cls, ), cdict)
+
+    def _load(self, document):
+        get = document.get
+        missing = 0
+        for key, bit in self._bits.items():
+            value = get(key, _MISSING)
+            if value is _MISSING:
+                missing |= bit
+                value = None
+            setattr(self, key, value)
+        self._missing = missing
+
+    @classmethod
+    def from_dict(cls, document):
+        record = cls.__new__(cls)
+        record._load(document)
+        return record
+
+    def to_dict(self):
+        missing = self._missing
+        if not missing:
+            return dict(zip(self.__slots__, self._values(self)))
+        return {
+            key : value for (key, bit), value in zip(self._bits.items(), self._values(self))
+            if value is not None or not missing & bit
+        }
+
+    def get_errors(self):
+        """Same as get_document_errors of the model, running directly on the attributes"""
+        if self._model._custom_errors:
+            return self._model.get_document_errors(self.to_dict())
+        out = []
+        for (key, on_none, checks), value in zip(self._model._error_plan, self._values(self)):
+            if value is None:
+                if on_none is not None:
+                    on_none(value, key, out)
+            else:
+                for check in checks:
+                    check(value, key, out)
+        return out
+
+    def is_valid(self):
+        """Same as is_document_valid of the model, running directly on the attributes"""
+        if self._model._custom_errors:
+            return self._model._is_valid(self.to_dict())
+        for (key, on_none, validators), value in zip(self._model._valid_plan, self._values(self)):
+            if value is None:
+                if on_none is not None and not on_none(value):
+                    return False
+            else:
+                for valid in validators:
+                    if not valid(value):
+                        return False
+        return True
+
+    def clean(self, set_default=True):
+        """Same as clean_document of the model, running Field.clean directly on the attributes"""
+        view = _RecordView(self)
+        for key, definition in self._model._fields.items():
+            definition.clean(view, key, set_default=set_default, remove_undefined=True)
+        return self
+
+    def __eq__(self, other):
+        return type(self) == type(other) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return "{0}({1})".format(type(self).__name__, self.to_dict())
@@ -0,0 +1,108 @@
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Author : Eric (github.com/ZwodahS)
+# License : Public Domain
+"""
+Ad-hoc benchmarks for the dict_utils traversals, on wide, deep and list heavy documents.
+
+The deep documents are deeper than the recursion limit, they check that none of the functions recurse on the data.
+The implementations these replaced can be compared by running this file on an older checkout.
+
+Run with : python -m dict_utils.dict_benchmark
+"""
+import sys
+import timeit
+
+from .dict_utils import compile_filter, compile_projection, dict_equal, dict_filter, dict_flatten
+
+
+def make_wide(keys=2000):
+    return { "k%d" % i : { "a" : i, "b" : "value %d" % i, "c" : [ i, i + 1 ] } for i in range(keys) }
+
+
+def make_deep(depth=5000):
+    root = node = {}
+    for i in range(depth):
+        node["v"] = i
+        node["c"] = {}
+        node = node["c"]
+    return root
+
+
+def make_lists(items=200):
+    return { "items" : [ { "a" : [ { "b" : j, "c" : [ j ] * 5 } for j in range(10) ], "d" : i } for i in range(items) ] }
+
+
+def _report(name, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    print("{0:<50} {1:>12.1f} ops/sec".format(name, number / seconds))
+    return seconds
+
+
+def bench_equal(documents, number):
+    print("== dict_equal ==")
+    for name, make in documents:
+        document, other = make(), make()
+        _report(name, lambda: dict_equal(document, other), number)
+
+
+def bench_flatten(documents, number):
+    print("== dict_flatten ==")
+    for name, make in documents:
+        document = make()
+        _report(name, lambda: dict_flatten(document), number)
+
+
+FILTERS = [
+    ("exclude", { "exclude" : ["c.c", "items.a.c"] }),
+    ("exclude, no empty values", { "exclude" : ["c.c", "items.a.c"], "preserve_empty_values" : False }),
+    ("include_only", { "include" : ["k1.a", "items.a.b", "c.v"], "include_only" : True }),
+]
+
+
+def bench_filter(documents, number):
+    print("== dict_filter ==")
+    for name, make in documents:
+        document = make()
+        for label, kwargs in FILTERS:
+            apply = compile_filter(**kwargs).apply
+            _report("{0}, {1}".format(name, label), lambda: apply(document), number)
+
+
+PROJECTIONS = [ ("c.c.v", "moved"), ("moved", "c.c.v"), ("items", "list"), ("list", "items") ]
+
+
+def bench_project(documents, number):
+    print("== dict_project, moving nested keys and back ==")
+    for name, make in documents:
+        document = make()
+        apply = compile_projection(PROJECTIONS).apply
+        _report(name, lambda: apply(document), number)
+
+
+def check(documents):
+    """Check the results of the functions on the documents, the deep ones included"""
+    for name, make in documents:
+        document = make()
+        assert dict_equal(document, make())
+        for _, kwargs in FILTERS:
+            assert dict_equal(compile_filter(**kwargs).apply(document), dict_filter(document, **kwargs))
+        assert dict_equal(compile_projection(PROJECTIONS).apply(make()), document)
+    deep = make_deep()
+    assert len(dict_flatten(deep)) == 5000 > sys.getrecursionlimit()
+    assert dict_filter(deep, exclude=["c.v"])["c"] == { "c" : deep["c"]["c"] }
+
+
+if __name__ == "__main__":
+    documents = [ ("wide", make_wide), ("deep", make_deep), ("lists", make_lists) ]
+    check(documents)
+    bench_equal(documents, 50)
+    bench_flatten(documents, 50)
+    bench_filter(documents, 50)
+    bench_project(documents, 2000)
@@ -0,0 +1,196 @@
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Author : Eric (github.com/ZwodahS)
+# License : Public Domain
+"""
+Bulk driver running dict_filter/dict_project/dict_flatten over newline delimited JSON files.
+
+    bulk_transform("in.jsonl", "out.jsonl", [
+        project_transform([("a.b", "b")]),
+        filter_transform(exclude=["c"]),
+    ])
+
+The input is memory-mapped and split into records with memoryview slices, without copying the lines.
+orjson is used to parse and write the records when it is installed, as it reads the slices directly.
+"""
+import json
+import mmap
+
+from .dict_utils import compile_filter, compile_projection, iter_flatten
+
+try:
+    import orjson
+except ImportError: # pragma: no cover
+    orjson = None
+
+
+if orjson is not None:
+    loads = orjson.loads
+    dumps = orjson.dumps
+else:
+    def loads(record):
+        return json.loads(bytes(record))
+
+    def dumps(data):
+        return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+def iter_records(path):
+    """
+    Yields a memoryview for each non blank line of the file at path, without the line ending.
+
+    The memoryview is only valid until the next record is requested, copy it (bytes(record)) to keep it.
+    """
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # empty file
+            return
+        with mm:
+            if hasattr(mm, "madvise"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            view = memoryview(mm)
+            try:
+                start = 0
+                size = len(mm)
+                find = mm.find
+                while start < size:
+                    end = find(b"\n", start)
+                    if end == -1:
+                        end = size
+                    stop = end - 1 if end > start and mm[end - 1] == 13 else end # \r\n
+                    if stop > start and (mm[start] not in b" \t\r" or mm[start:stop].strip()):
+                        record = view[start:stop]
+                        try:
+                            yield record
+                        finally:
+                            record.release()
+                    start = end + 1
+            finally:
+                view.release()
+
+
+def filter_transform(include=None, exclude=None, include_only=False, preserve_empty_values=True):
+    """A transform running dict_filter, see compile_filter"""
+    return compile_filter(include=include, exclude=exclude, include_only=include_only,
+                          preserve_empty_values=preserve_empty_values).apply
+
+
+def project_transform(projections):
+    """A transform running dict_project, see compile_projection"""
+    return compile_projection(projections).apply
+
+
+def flatten_transform(flatten_list=True):
+    """A transform running dict_flatten, returning a dictionary of { dotted key : value }"""
+    def _flatten(data):
+        return dict(iter_flatten(data, flatten_list=flatten_list))
+    return _flatten
+
+
+def bulk_transform(source, output, transforms, buffer_size=1 << 20):
+    """
+    Run a chain of transforms over each record of a newline delimited JSON file.
+
+    source              The path of the input file.
+    output              A path or a binary file object, the transformed records are written to it one per line.
+    transforms          A list of functions taking a record and returning the transformed record.
+                        If a transform returns None, the record is dropped.
+    buffer_size         The output is written in batches of at least this many bytes.
+
+    Returns { "records" : records read, "written" : records written }
+    """
+    records = written = 0
+    pending = []
+    pending_size = 0
+
+    f = open(output, "wb") if isinstance(output, str) else output
+    try:
+        for record in iter_records(source):
+            records += 1
+            data = loads(record)
+            for transform in transforms:
+                data = transform(data)
+                if data is None:
+                    break
+            else:
+                line = dumps(data)
+                pending.append(line)
+                pending_size += len(line) + 1
+                written += 1
+                if pending_size >= buffer_size:
+                    pending.append(b"")
+                    f.write(b"\n".join(pending))
+                    pending = []
+                    pending_size = 0
+        if pending:
+            pending.append(b"")
+            f.write(b"\n".join(pending))
+    finally:
+        if f is not output:
+            f.close()
+    return { "records" : records, "written" : written }
+
+
+if __name__ == "__main__":
+    # python -m dict_utils.dict_bulk [records]
+    import os
+    import sys
+    import tempfile
+    import time
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    projections = [ ("user.name", "name"), ("user.address.city", "city") ]
+    exclude = [ "tags", "user.address" ]
+
+    def make_record(i):
+        return {
+            "_id" : i, "tags" : [ "a", "b", "c" ], "score" : i * 0.5,
+            "user" : { "name" : "user{0}".format(i), "email" : "user{0}@example.com".format(i),
+                       "address" : { "city" : "city{0}".format(i % 100), "zip" : "{0:05d}".format(i) } },
+        }
+
+    def naive(source, output):
+        project = compile_projection(projections).apply
+        dict_filter = compile_filter(exclude=exclude).apply
+        with open(source) as f, open(output, "w") as out:
+            for line in f:
+                if not line.strip():
+                    continue
+                data = dict(iter_flatten(dict_filter(project(json.loads(line)))))
+                out.write(json.dumps(data, separators=(",", ":")))
+                out.write("\n")
+
+    def bulk(source, output):
+        bulk_transform(source, output, [
+            project_transform(projections), filter_transform(exclude=exclude), flatten_transform(),
+        ])
+
+    directory = tempfile.mkdtemp()
+    source = os.path.join(directory, "input.jsonl")
+    with open(source, "w") as f:
+        for i in range(count):
+            f.write(json.dumps(make_record(i)))
+            f.write("\n")
+    size = os.path.getsize(source) / (1024 * 1024)
+    print("{0} records, {1:.1f} MB, orjson : {2}".format(count, size, orjson is not None))
+
+    outputs = {}
+    for name, func in (("naive", naive), ("bulk", bulk)):
+        outputs[name] = os.path.join(directory, name + ".jsonl")
+        start = time.perf_counter()
+        func(source, outputs[name])
+        seconds = time.perf_counter() - start
+        print("{0:<8} {1:.2f}s  {2:.0f} records/sec  {3:.1f} MB/s".format(name, seconds, count / seconds, size / seconds))
+
+    with open(outputs["naive"], "rb") as a, open(outputs["bulk"], "rb") as b:
+        assert [ json.loads(l) for l in a ] == [ json.loads(l) for l in b ]
+    for path in list(outputs.values()) + [ source ]:
+        os.remove(path)
+    os.rmdir(directory)
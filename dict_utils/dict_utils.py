@@ -9,6 +9,229 @@
 # Author : Eric (github.com/ZwodahS)
 # License : Public Domain
 
+import functools
+
+
+def _split_fields(fields):
+    """
+    Separate a list of fields to a set of non-subdocumented fields and a dictionary
+    whose keys are the subdocuments and values are lists of their fields.
+
+    Example:
+        fields = ["email", "address", "address.coordinates"]
+        Return : {"email", "address"} { "address" : [ "coordinates" ] }
+    """
+    output_fields = set()
+    output_dict = {}
+    for field in fields:
+        head, dot, rest = field.partition(".")
+        if dot:
+            output_dict.setdefault(head, []).append(rest)
+        else:
+            output_fields.add(field)
+    return output_fields, output_dict
+
+
+class _FilterNode(object):
+    """A level of the trie built by compile_filter"""
+
+    __slots__ = ("include_only_keys", "exclude_fields", "exclude_children", "include_children", "include_keys", "is_flat")
+
+    def __init__(self, include, exclude):
+        include_fields, include_dict = _split_fields(include)
+        exclude_fields, exclude_dict = _split_fields(exclude)
+        children = {
+            k : _FilterNode(include_dict.get(k, ()), exclude_dict.get(k, ()))
+            for k in set(include_dict) | set(exclude_dict)
+        }
+        self.include_only_keys = tuple(include_fields - exclude_fields)
+        self.exclude_fields = frozenset(exclude_fields)
+        self.exclude_children = { k : children[k] for k in exclude_dict }
+        self.include_children = tuple((k, children[k]) for k in include_dict)
+        self.include_keys = frozenset(include_dict)
+        self.is_flat = not include_dict and not exclude_dict
+
+
+class _Filter(object):
+    """
+    Builds the output of a DictFilter.
+
+    The containers are walked depth first with an explicit stack, so there is no limit on the depth.
+    The context of a value is (trie node, use_self_keys, parent output, index in the parent output), the output
+    of each container is created in _enter_dict/_enter_list and stored in its parent, the other values are copied as is.
+    The dictionaries of a trie node without children are filtered directly by their parent, without being walked.
+    """
+
+    __slots__ = ("preserve_empty_values", )
+
+    exit = None # called with the context of each walked container once its children are filtered
+
+    def __init__(self, preserve_empty_values):
+        self.preserve_empty_values = preserve_empty_values
+
+    def run(self, node, data, use_self_keys):
+        output = [None]
+        context = (node, use_self_keys, output, 0)
+        children = self._enter(data, context)
+        if children is None:
+            return output[0]
+
+        enter, exit = self._enter, self.exit
+        stack = []
+        push, pop = stack.append, stack.pop
+        children = iter(children)
+        while True:
+            for value, child_context in children:
+                grandchildren = enter(value, child_context)
+                if grandchildren is not None:
+                    push((children, context))
+                    children, context = iter(grandchildren), child_context
+                    break
+            else:
+                if exit is not None:
+                    exit(context)
+                if not stack:
+                    return output[0]
+                children, context = pop()
+
+    def _enter(self, data, context):
+        """Store the output of data in its parent, returns the (value, context) of its children to walk, or None"""
+        t = type(data)
+        if t is dict:
+            return self._enter_dict(data, context)
+        if t is list:
+            return self._enter_list(data, context)
+        _, use_self_keys, parent, index = context
+        parent[index] = data if use_self_keys else None
+        return None
+
+    def _filter_flat(self, node, data, use_self_keys):
+        """The output of the dictionary data for a trie node without children"""
+        if use_self_keys:
+            exclude_fields = node.exclude_fields
+            if self.preserve_empty_values:
+                return { k : v for k, v in data.items() if k not in exclude_fields }
+            return { k : v for k, v in data.items() if v and k not in exclude_fields }
+        if self.preserve_empty_values:
+            return { k : data[k] for k in node.include_only_keys if k in data }
+        return { k : data[k] for k in node.include_only_keys if data.get(k) }
+
+    def _enter_dict(self, data, context):
+        node, use_self_keys, parent, index = context
+        preserve_empty_values = self.preserve_empty_values
+        exclude_children = node.exclude_children
+        if use_self_keys:
+            exclude_fields = node.exclude_fields
+            keys = [ k for k in data if k not in exclude_fields ]
+        else:
+            keys = [ k for k in node.include_only_keys if k in data ]
+
+        out = parent[index] = {}
+        children = []
+        for k in keys:
+            value = data[k]
+            if k in exclude_children and type(value) in (list, dict):
+                child = exclude_children[k]
+                if child.is_flat and type(value) is dict:
+                    value = self._filter_flat(child, value, True)
+                    if preserve_empty_values or value:
+                        out[k] = value
+                elif not preserve_empty_values and k in node.include_keys:
+                    # whether the include filter applies depends on this value being empty, so it is needed now.
+                    value = self.run(child, value, True)
+                    if value:
+                        out[k] = value
+                else:
+                    out[k] = None
+                    children.append((value, (child, True, out, k)))
+            elif preserve_empty_values or value:
+                out[k] = value
+
+        for k, child in node.include_children:
+            if k in data and k not in out:
+                value = data[k]
+                if child.is_flat and type(value) is dict:
+                    value = self._filter_flat(child, value, False)
+                    if preserve_empty_values or value:
+                        out[k] = value
+                elif type(value) in (list, dict):
+                    out[k] = None
+                    children.append((value, (child, False, out, k)))
+                elif preserve_empty_values:
+                    out[k] = None
+        return children if children or not preserve_empty_values else None
+
+    def _enter_list(self, data, context):
+        node, use_self_keys, parent, index = context
+        out = parent[index] = []
+        children = []
+        flat = node.is_flat
+        for ind, value in enumerate(data):
+            if flat and type(value) is dict:
+                out.append(self._filter_flat(node, value, use_self_keys))
+            elif type(value) in (list, dict):
+                out.append(None)
+                children.append((value, (node, use_self_keys, out, ind)))
+            else:
+                out.append(value if use_self_keys else None)
+        return children if children or not self.preserve_empty_values else None
+
+
+class _CompactFilter(_Filter):
+    """
+    A _Filter that also removes the empty values, used when preserve_empty_values is False.
+
+    The containers are compacted in exit, once their children are filtered.
+    """
+
+    __slots__ = ()
+
+    def exit(self, context):
+        _, _, parent, index = context
+        out = parent[index]
+        if type(out) is list:
+            out[:] = [ v for v in out if v ]
+        if type(parent) is dict and not out:
+            del parent[index]
+
+
+class DictFilter(object):
+    """
+    A dict_filter compiled once and applied to many dictionaries, see compile_filter.
+    """
+
+    def __init__(self, include=None, exclude=None, include_only=False, preserve_empty_values=True):
+        self.include = tuple(include or ())
+        self.exclude = tuple(exclude or ())
+        self.include_only = include_only
+        self.preserve_empty_values = preserve_empty_values
+        self._root = _FilterNode(self.include, self.exclude)
+        self._filter = (_Filter if preserve_empty_values else _CompactFilter)(preserve_empty_values)
+
+    def apply(self, data):
+        """Returns a new dictionary that match the criteria, see dict_filter"""
+        return self._filter.run(self._root, data, not self.include_only)
+
+    def __call__(self, data):
+        return self.apply(data)
+
+
+def compile_filter(include=None, exclude=None, include_only=False, preserve_empty_values=True):
+    """
+    Compile the arguments of dict_filter into a DictFilter.
+    The fields are split into a trie once, DictFilter.apply only walks the data.
+
+        f = compile_filter(include=["a.b"], include_only=True)
+        f.apply(data) == dict_filter(data, include=["a.b"], include_only=True)
+    """
+    return DictFilter(include=include, exclude=exclude, include_only=include_only, preserve_empty_values=preserve_empty_values)
+
+
+@functools.lru_cache(maxsize=256)
+def _cached_filter(include, exclude, include_only, preserve_empty_values):
+    return compile_filter(include=include, exclude=exclude, include_only=include_only, preserve_empty_values=preserve_empty_values)
+
+
 def dict_filter(data, include=None, exclude=None, include_only=False, preserve_empty_values=True):
     """
     Takes in a data in the form of dictionary, returns a new dictionary that match the criteria
@@ -35,72 +258,185 @@ def dict_filter(data, include=None, exclude=None, include_only=False, preserve_e
         If include_only is False
             start with everything,
 
+    The filters are compiled with compile_filter and cached, use compile_filter directly to hold on to one.
     """
-    def _fields_dict_filter(fields):
-        '''
-        Separate a list of fields to a set of non-subdocumented fields and a dictionary
-        whose keys are the subdocuments and values are lists of their fields.
+    include = tuple(include) if isinstance(include, list) else None
+    exclude = tuple(exclude) if isinstance(exclude, list) else None
+    return _cached_filter(include, exclude, bool(include_only), bool(preserve_empty_values)).apply(data)
 
-        Example:
-            fields = ["email", "address", "address.coordinates"]
-            Return : {"email", "address"} { "address" : [ "coordinates" ] }
-        '''
-        output_fields = set()
-        output_dict = {}
 
-        if isinstance(fields, list):
-            for field in fields:
+_MISSING = object()
 
-                if '.' in field:
-                    split = field.split(".")
-                    if not split[0] in output_dict:
-                        output_dict[split[0]] = []
 
-                    output_dict[split[0]] += [".".join(split[1:])]
+def _is_prefix_related(path1, path2):
+    n = min(len(path1), len(path2))
+    return path1[:n] == path2[:n]
 
-                else:
-                    output_fields |= {field}
 
-        return output_fields, output_dict
+def _reads_target(original_field, target_field):
+    """
+    Returns True if finding original_field can see the result of setting target_field.
+    A target ending with '' sets nothing but still creates the dictionaries leading to it,
+    which will be removed if original_field walks into them.
+    """
+    if _is_prefix_related(original_field, target_field):
+        return True
+    return target_field[-1] == '' and len(target_field) > 1 and original_field[0] == target_field[0]
 
-    def _internal_filter(_data, _include, _exclude, _use_self_keys):
-        """
-        keep include_only as a fixed value and use _use_self_keys as the dynamic one.
-        """
-        if type(_data) not in [dict, list]:
-            return _data if _use_self_keys else None
 
-        if isinstance(_data, list):
-            t = [ _internal_filter(_d, _include, _exclude, _use_self_keys) for _d in _data ]
-            t = [ v for v in t if preserve_empty_values or v ]
-            return t
+def _build_projection_trie(paths):
+    """
+    Build a trie out of [(path, slot)], each node is (key, slot, children, slots).
+    slot is None for inner nodes, slots contains all the slots under the node.
+    """
+    root = {}
+    for path, slot in paths:
+        node = root
+        for key in path[:-1]:
+            node = node.setdefault(key, [None, {}])[1]
+        node[path[-1]] = [slot, {}]
 
-        include_fields, include_dict = _fields_dict_filter(_include)
-        exclude_fields, exclude_dict = _fields_dict_filter(_exclude)
+    def _freeze(nodes):
+        output = []
+        for key, (slot, children) in nodes.items():
+            children = _freeze(children)
+            slots = (slot, ) if slot is not None else tuple(s for child in children for s in child[3])
+            output.append((key, slot, children, slots))
+        return tuple(output)
 
-        keys = ((set() if not _use_self_keys else set(_data.keys())) | include_fields) - exclude_fields
-        out = {}
+    return _freeze(root)
 
-        for k in keys:
-            if k in _data:
-                value = None
-                if k in exclude_dict and type(_data[k]) in [list, dict]:
-                    value = _internal_filter(_data[k], include_dict.get(k, []), exclude_dict.get(k), True)
-                else:
-                    value = _data[k]
 
-                if preserve_empty_values or value:
-                    out[k] = value
+def _projection_unset(data, nodes, values):
+    """
+    Finds and unsets the original fields of a phase of DictProjection, storing the values found in values.
+    Dictionaries emptied are removed. Only the trie is followed, so the recursion is bounded by the number of
+    parts of the longest field, not by the depth of data.
+    """
+    for key, slot, children, _ in nodes:
+        if slot is not None:
+            if key in data:
+                values[slot] = data.pop(key)
+        else:
+            child = data.get(key)
+            if type(child) == dict:
+                _projection_unset(child, children, values)
+                if len(child) == 0:
+                    del data[key]
+
+
+def _projection_set(data, nodes, values):
+    """
+    Sets the target fields of a phase of DictProjection from values, creating the dictionaries leading to them.
+    """
+    for key, slot, children, slots in nodes:
+        if slot is not None:
+            value = values[slot]
+            if value is not _MISSING and key != '':
+                data[key] = value
+        else:
+            for s in slots:
+                if values[s] is not _MISSING:
+                    break
+            else:
+                continue # nothing to set under this node
+            if key not in data:
+                data[key] = {}
+            elif type(data[key]) != dict:
+                continue # do not try to set anything
+            _projection_set(data[key], children, values)
+
+
+class DictProjection(object):
+    """
+    A dict_project compiled once and applied to many dictionaries, see compile_projection.
+
+    The projections are split into phases, the projections within a phase do not depend on each other.
+    For each phase, all the original fields are found and unset in a single walk of a trie, then all the
+    target fields are set in a single walk of another trie.
+    A projection starts a new phase if its original field overlaps the original field or could see the
+    target field of a projection in the current phase, or if its target field overlaps the target field of one.
+    """
+
+    def __init__(self, projections):
+        self.projections = [ tuple(p) for p in projections ]
+        self._phases = []
+
+        current = []
+        for p in self.projections:
+            original_field = tuple(p[0].split("."))
+            target_field = tuple(p[1].split("."))
+            if any(_is_prefix_related(original_field, o) or _reads_target(original_field, t) or
+                   _is_prefix_related(target_field, t) for o, t, _ in current):
+                self._phases.append(self._compile_phase(current))
+                current = []
+            current.append((original_field, target_field, p[2] if len(p) == 3 else _MISSING))
+        if current:
+            self._phases.append(self._compile_phase(current))
+
+    @staticmethod
+    def _compile_phase(projections):
+        unset_trie = _build_projection_trie([ (o, slot) for slot, (o, _, _) in enumerate(projections) ])
+        set_trie = _build_projection_trie([ (t, slot) for slot, (_, t, _) in enumerate(projections) ])
+        defaults = tuple(default for _, _, default in projections)
+        return unset_trie, set_trie, defaults
+
+    def apply(self, data):
+        """Project data in place and returns it, see dict_project"""
+        if type(data) != dict:
+            return data
+        for unset_trie, set_trie, defaults in self._phases:
+            values = list(defaults)
+            _projection_unset(data, unset_trie, values)
+            _projection_set(data, set_trie, values)
+        return data
+
+    def apply_many(self, documents):
+        """Project each document of an iterable, yielding them one at a time"""
+        for document in documents:
+            yield self.apply(document)
+
+    def __call__(self, data):
+        return self.apply(data)
+
+
+def compile_projection(projections):
+    """
+    Compile the projections of dict_project into a DictProjection.
+    The fields are split and merged into tries once, DictProjection.apply only walks the data.
+
+        p = compile_projection([("a.c", "abc"), ("a.e", "e", 0)])
+        p.apply(data) == dict_project(data, [("a.c", "abc"), ("a.e", "e", 0)])
+    """
+    return DictProjection(projections)
+
 
-        for k in include_dict:
-            if k in _data and not k in out:
-                value = _internal_filter(_data[k], include_dict.get(k), exclude_dict.get(k, []), False)
-                if preserve_empty_values or value:
-                    out[k] = value
+@functools.lru_cache(maxsize=256)
+def _cached_projection(key):
+    return compile_projection(p[0] for p in key)
 
-        return out
 
-    return _internal_filter(data, include, exclude, not include_only)
+_CACHED_DEFAULT_TYPES = (type(None), bool, int, str, bytes)
+
+
+def _projection_key(projections):
+    """
+    Returns the key of projections in the cache of dict_project, or None if they should not be cached.
+
+    Equal values of different types (0, False and 0.0) hash the same, so the type of each default is part of the key.
+    Floats are keyed on their repr to keep 0.0 and -0.0 apart, and the other types are not cached.
+    """
+    key = []
+    for p in projections:
+        if len(p) != 3:
+            key.append((p, None))
+        elif type(p[2]) in _CACHED_DEFAULT_TYPES:
+            key.append((p, type(p[2])))
+        elif type(p[2]) is float:
+            key.append((p, repr(p[2])))
+        else:
+            return None
+    return tuple(key)
 
 
 def dict_project(data, projections):
@@ -115,72 +451,120 @@ def dict_project(data, projections):
 
                         if default_value is omitted, then there will be no default value set if the value do not exist in the
                         original field
-    """
-    def _find_value_and_unset(_data, _fields):
-        if len(_fields) == 1:
-            if type(_data) == dict and _fields[0] in _data:
-                value = _data[_fields[0]]
-                del _data[_fields[0]]
-                return value, True
-            else:
-                return None, False
-        else:
-            if _fields[0] in _data:
-                if type(_data[_fields[0]]) == dict:
-                    value, found = _find_value_and_unset(_data[_fields[0]], _fields[1:])
-                    if len(_data[_fields[0]]) == 0:
-                        del _data[_fields[0]]
-                    return value, found
-            else:
-                return None, False
 
-    def _find_and_set(_data, _fields, value):
-        if len(_fields) == 1:
-            if _fields[0] != '':
-                _data[_fields[0]] = value
-        else:
-            if _fields[0] not in _data:
-                _data[_fields[0]] = {}
-                _find_and_set(_data[_fields[0]], _fields[1:], value)
-            else:
-                if type(_data[_fields[0]])!= dict:
-                    return # do not try to set anything
-                else:
-                    _find_and_set(_data[_fields[0]], _fields[1:], value)
-
-    for p in projections:
-        original_field = p[0].split(".")
-        target_field = p[1].split(".")
-        value, found = _find_value_and_unset(data, original_field)
-        if found:
-            _find_and_set(data, target_field, value)
-        elif len(p) == 3:
-            _find_and_set(data, target_field, p[2])
-
-    return data
+    The projections are compiled with compile_projection and cached, use compile_projection directly to hold on to one.
+    """
+    projections = tuple(tuple(p) for p in projections)
+    key = _projection_key(projections)
+    projection = compile_projection(projections) if key is None else _cached_projection(key)
+    return projection.apply(data)
 
 def dict_equal(d1, d2):
     """
-    recursively check if 2 dictionary is the same.
+    check if 2 dictionary is the same.
+
+    The values needs to be of the same type to be equal, i.e. 1 and 1.0 are not equal.
+    The documents are walked with an explicit stack, stopping at the first difference.
+    Values that are the same object are not walked.
     """
+    if d1 is d2:
+        return True
     if type(d1) != type(d2):
         return False
-
-    if isinstance(d1, dict) and isinstance(d2, dict):
-        set_all = set(d1.keys() + d2.keys())
-        for k in set_all:
-            if k not in d1 or k not in d2:
-                return False
-            if not dict_equal(d1.get(k), d2.get(k)):
-                return False
-
-    if isinstance(d1, list) and isinstance(d2, list):
-        if len(d1) != len(d2):
+    if not isinstance(d1, (dict, list)):
+        return d1 == d2
+
+    stack = [(d1, d2)]
+    push, pop = stack.append, stack.pop
+    while stack:
+        a, b = pop()
+        if len(a) != len(b):
             return False
+        if isinstance(a, dict):
+            get = b.get
+            for k, v in a.items():
+                w = get(k, _MISSING)
+                if v is w:
+                    continue
+                if type(v) != type(w):
+                    return False
+                if isinstance(v, (dict, list)):
+                    push((v, w))
+                elif v != w:
+                    return False
+        else:
+            for v, w in zip(a, b):
+                if v is w:
+                    continue
+                if type(v) != type(w):
+                    return False
+                if isinstance(v, (dict, list)):
+                    push((v, w))
+                elif v != w:
+                    return False
+    return True
+
+
+DIFF_ADDED = "added"
+DIFF_REMOVED = "removed"
+DIFF_CHANGED = "changed"
+
+
+def _iter_diff_children(a, b):
+    if isinstance(a, dict):
+        for k, v in a.items():
+            yield str(k), v, b.get(k, _MISSING)
+        for k, w in b.items():
+            if k not in a:
+                yield str(k), _MISSING, w
+    else:
+        for index in range(max(len(a), len(b))):
+            yield (str(index), a[index] if index < len(a) else _MISSING,
+                   b[index] if index < len(b) else _MISSING)
+
+
+def dict_diff(d1, d2):
+    """
+    Lazily yields the differences between 2 dictionary as (change, dotted key, old value, new value).
 
-        return all([dict_equal(d[0], d[1]) for d in zip(d1, d2)])
+    change              DIFF_ADDED if the key is only in d2, old value is None
+                        DIFF_REMOVED if the key is only in d1, new value is None
+                        DIFF_CHANGED if the values are different, see dict_equal
 
-    return d1 == d2
+    Dictionaries and lists of the same type are walked instead of reported as changed.
+    Lists are compared index by index. The root is reported with the key "".
+    The documents are never copied, the values yielded are the values in the documents.
+    """
+    def _descend(a, b):
+        return type(a) == type(b) and isinstance(a, (dict, list))
+
+    if d1 is d2:
+        return
+    if not _descend(d1, d2):
+        if type(d1) != type(d2) or d1 != d2:
+            yield DIFF_CHANGED, "", d1, d2
+        return
+
+    path = []
+    stack = [_iter_diff_children(d1, d2)]
+    while stack:
+        for k, v, w in stack[-1]:
+            if v is w:
+                continue
+            if v is _MISSING:
+                yield DIFF_ADDED, ".".join(path + [k]), None, w
+            elif w is _MISSING:
+                yield DIFF_REMOVED, ".".join(path + [k]), v, None
+            elif _descend(v, w):
+                path.append(k)
+                stack.append(_iter_diff_children(v, w))
+                break
+            elif type(v) != type(w) or v != w:
+                yield DIFF_CHANGED, ".".join(path + [k]), v, w
+        else:
+            stack.pop()
+            if path:
+                path.pop()
 
 
 def dict_combine(d1, d2): # d1 + d2, conflicting keys will be taken from d1
@@ -189,29 +573,113 @@ def dict_combine(d1, d2): # d1 + d2, conflicting keys will be taken from d1
     return d3
 
 
-def dict_flatten(item, flatten_list=True):
-    def _flatten(key, value):
-        if isinstance(value, dict):
-            attributes = []
-            for k, v in value.items():
-                _k = []
-                _k.extend(key)
-                _k.append(k)
-                attributes.extend(_flatten(_k, v))
-
-            return attributes
-        elif isinstance(value, list) and flatten_list:
-            output = []
-            for index, v in enumerate(value):
-                _k = []
-                _k.extend(key)
-                _k.append(str(index))
-                output.extend(_flatten(_k, v))
-            return output
+_INDEX_KEYS = tuple(str(index) for index in range(1024))
+
+
+def _iter_children(value):
+    """Returns an iterator of (key, value) of a dictionary or a list, the keys of a list are its indexes as strings"""
+    if isinstance(value, dict):
+        return iter(value.items())
+    if len(value) <= len(_INDEX_KEYS):
+        return zip(_INDEX_KEYS, value)
+    return zip(map(str, range(len(value))), value)
+
+
+def iter_flatten(item, flatten_list=True):
+    """
+    Lazily flatten a dictionary, yielding (dotted key, value) for each leaf value.
+
+    item                The dictionary
+    flatten_list        If True, lists are flattened as well, using the index as the key.
+
+    The walk uses an explicit stack, so there is no limit on the depth of the dictionary.
+    Empty dictionaries (and empty lists if flatten_list is True) yield nothing.
+    """
+    containers = (dict, list) if flatten_list else dict
+    if not isinstance(item, containers):
+        yield "", item
+        return
+
+    # the stack holds (iterator, prefix) of the parents, the prefix of a container is only built when it has a
+    # value to yield, from the prefix of its parent if there is one, so the memory used is linear in the depth.
+    path = []
+    stack = []
+    push, pop = stack.append, stack.pop
+    prefix = ""
+    children = _iter_children(item)
+    while True:
+        for k, v in children:
+            if isinstance(v, containers):
+                push((children, prefix))
+                path.append(k)
+                prefix = None
+                children = _iter_children(v)
+                break
+            if prefix is None:
+                parent = stack[-1][1]
+                prefix = parent + path[-1] + "." if parent is not None else ".".join(path) + "."
+            yield prefix + k, v
         else:
-            return [(".".join(key), value)]
+            if not stack:
+                return
+            children, prefix = pop()
+            path.pop()
+
+
+def dict_flatten(item, flatten_list=True):
+    """
+    Flatten a dictionary into a list of (dotted key, value), see iter_flatten
+    """
+    return list(iter_flatten(item, flatten_list=flatten_list))
+
+
+def dict_unflatten(items, unflatten_list=True):
+    """
+    Rebuild a dictionary from (dotted key, value) pairs, the reverse of iter_flatten.
+
+    items               The dictionary with dotted keys, or an iterable of (dotted key, value)
+    unflatten_list      If True, numeric keys create lists instead of dictionaries.
+                        Missing indexes are filled with None.
+
+    The empty key "" returns the value itself, matching what iter_flatten yields for a non dictionary.
+    Empty dictionaries and lists are not yielded by iter_flatten, so they will not be rebuilt.
+    """
+    if isinstance(items, dict):
+        items = items.items()
+
+    def _is_index(key):
+        return unflatten_list and key.isdigit()
+
+    root = None
+    for key, value in items:
+        if key == "":
+            root = value
+            continue
+        fields = key.split(".")
+        if root is None:
+            root = [] if _is_index(fields[0]) else {}
+        container = root
+        for ind, field in enumerate(fields):
+            last = ind == len(fields) - 1
+            child = value if last else ([] if _is_index(fields[ind + 1]) else {})
+            if isinstance(container, list):
+                if not field.isdigit():
+                    raise ValueError("Invalid key for list : {0}".format(key))
+                index = int(field)
+                if index >= len(container):
+                    container.extend([None] * (index - len(container) + 1))
+                if last or container[index] is None:
+                    container[index] = child
+                child = container[index]
+            elif isinstance(container, dict):
+                if last or field not in container:
+                    container[field] = child
+                child = container[field]
+            else:
+                raise ValueError("Conflicting key : {0}".format(key))
+            container = child
+    return root
 
-    return _flatten([], item)
 
 if __name__ == "__main__":
     import copy
@@ -247,7 +715,8 @@ if __name__ == "__main__":
     for test in TESTS:
         result = dict_filter(test_data, **test[1])
         expectation = test[2]
-        matched = dict_equal(result, expectation)
+        # the compiled filter returns the same as dict_filter
+        matched = dict_equal(result, expectation) and dict_equal(compile_filter(**test[1]).apply(test_data), expectation)
         print("Test ({0}) Result : {1}".format(test[0], "Pass" if matched else "Failed"))
         if matched:
             tests1[0]+=1
@@ -266,6 +735,8 @@ if __name__ == "__main__":
         ('projectiononadictionary', [('a', 'a-copy')], {'a-copy':{'b':1, 'c':2, 'd':3}, 'b':[1, 2, 3, 4], 'c':[{'a':{'b':1}, 'b':{'a':1}}, {'a':{'b':2, 'c':3}}], 'd':{'a':1, 'b':{'c':1}}}),
         ('testnodefaultvalue', [('a.e', 'e')], {'a':{'b':1, 'c':2, 'd':3}, 'b':[1, 2, 3, 4], 'c':[{'a':{'b':1}, 'b':{'a':1}}, {'a':{'b':2, 'c':3}}], 'd':{'a':1, 'b':{'c':1}}}),
         ('testdefaultvalue', [('a.e', 'e', 0)], {'a':{'b':1, 'c':2, 'd':3}, 'b':[1, 2, 3, 4], 'c':[{'a':{'b':1}, 'b':{'a':1}}, {'a':{'b':2, 'c':3}}], 'd':{'a':1, 'b':{'c':1}}, 'e':0}),
+        ('testdefaultvaluebool', [('a.e', 'e', False)], {'a':{'b':1, 'c':2, 'd':3}, 'b':[1, 2, 3, 4], 'c':[{'a':{'b':1}, 'b':{'a':1}}, {'a':{'b':2, 'c':3}}], 'd':{'a':1, 'b':{'c':1}}, 'e':False}),
+        ('testdefaultvaluefloat', [('a.e', 'e', 0.0)], {'a':{'b':1, 'c':2, 'd':3}, 'b':[1, 2, 3, 4], 'c':[{'a':{'b':1}, 'b':{'a':1}}, {'a':{'b':2, 'c':3}}], 'd':{'a':1, 'b':{'c':1}}, 'e':0.0}),
         ('projectiononexistingfieldswillreplace', [('a.b', 'b')], {'a':{'c':2, 'd':3}, 'b':1, 'c':[{'a':{'b':1}, 'b':{'a':1}}, {'a':{'b':2, 'c':3}}], 'd':{'a':1, 'b':{'c':1}}}),
         ('projectiononinnerfieldwhenouterisnotdict', [('a.b', 'b.b')], {'a':{'c':2, 'd':3}, 'b':[1, 2, 3, 4], 'c':[{'a':{'b':1}, 'b':{'a':1}}, {'a':{'b':2, 'c':3}}], 'd':{'a':1, 'b':{'c':1}}}),
         ('projectionwilldestroyemptydictionary', [('d.b.c', 'e')], {'a':{'b':1, 'c':2, 'd':3}, 'b':[1, 2, 3, 4], 'c':[{'a':{'b':1}, 'b':{'a':1}}, {'a':{'b':2, 'c':3}}], 'd':{'a':1}, 'e':1}),
@@ -276,7 +747,9 @@ if __name__ == "__main__":
         temp = copy.deepcopy(test_data)
         dict_project(temp, test[1])
         expectation = test[2]
-        matched = dict_equal(temp, expectation)
+        # the compiled projection projects the same as dict_project
+        compiled = compile_projection(test[1]).apply(copy.deepcopy(test_data))
+        matched = dict_equal(temp, expectation) and dict_equal(compiled, expectation)
         print("Test ({0}) Result : {1}".format(test[0], "Pass" if matched else "Failed"))
         if matched:
             tests2[0]+=1
@@ -289,5 +762,62 @@ if __name__ == "__main__":
             print("Found : ")
             pp.pprint(temp)
 
+    # test case : (title, item, flatten_list, expectation of dict_flatten, expectation of dict_unflatten of it)
+    TESTS = [
+        ('flattennested', {'a':{'b':1, 'c':{'d':2}}, 'e':3}, True, [('a.b', 1), ('a.c.d', 2), ('e', 3)], {'a':{'b':1, 'c':{'d':2}}, 'e':3}),
+        ('flattenlists', {'a':[1, {'b':2}, [3]]}, True, [('a.0', 1), ('a.1.b', 2), ('a.2.0', 3)], {'a':[1, {'b':2}, [3]]}),
+        ('flattenkeepslists', {'a':[1, {'b':2}], 'c':{'d':[]}}, False, [('a', [1, {'b':2}]), ('c.d', [])], {'a':[1, {'b':2}], 'c':{'d':[]}}),
+        ('flattenemptyvaluesyieldnothing', {'a':{}, 'b':[], 'c':None}, True, [('c', None)], {'c':None}),
+        ('flattennondictionary', 1, True, [('', 1)], 1),
+        ('flattentestdata', test_data, True, [('a.b', 1), ('a.c', 2), ('a.d', 3), ('b.0', 1), ('b.1', 2), ('b.2', 3), ('b.3', 4), ('c.0.a.b', 1), ('c.0.b.a', 1), ('c.1.a.b', 2), ('c.1.a.c', 3), ('d.a', 1), ('d.b.c', 1)], test_data),
+    ]
+    tests3 = [0, 0, 0]
+    for test in TESTS:
+        result = dict_flatten(test[1], flatten_list=test[2])
+        expectation = test[3]
+        # iter_flatten yields the same lazily, and dict_unflatten rebuilds the item from its flattened form
+        matched = (result == expectation and list(iter_flatten(test[1], flatten_list=test[2])) == expectation and
+                   dict_equal(dict_unflatten(result, unflatten_list=test[2]), test[4]))
+        print("Test ({0}) Result : {1}".format(test[0], "Pass" if matched else "Failed"))
+        if matched:
+            tests3[0]+=1
+        else:
+            tests3[1]+=1
+        tests3[2]+=1
+        if not matched:
+            print("Expectation : ")
+            pp.pprint(expectation)
+            print("Found : ")
+            pp.pprint(result)
+
+    # test case : (title, d1, d2, expectation of dict_diff)
+    TESTS = [
+        ('diffsamedictionary', test_data, copy.deepcopy(test_data), []),
+        ('diffaddedkey', {'a':{'b':1}}, {'a':{'b':1, 'c':2}}, [(DIFF_ADDED, 'a.c', None, 2)]),
+        ('diffremovedkey', {'a':{'b':1, 'c':2}}, {'a':{'b':1}}, [(DIFF_REMOVED, 'a.c', 2, None)]),
+        ('diffchangedvalue', {'a':{'b':1}}, {'a':{'b':2}}, [(DIFF_CHANGED, 'a.b', 1, 2)]),
+        ('diffchangedtype', {'a':1, 'b':[1]}, {'a':1.0, 'b':{'0':1}}, [(DIFF_CHANGED, 'a', 1, 1.0), (DIFF_CHANGED, 'b', [1], {'0':1})]),
+        ('difflistindexes', {'a':[1, 2, 3]}, {'a':[1, 4]}, [(DIFF_CHANGED, 'a.1', 2, 4), (DIFF_REMOVED, 'a.2', 3, None)]),
+        ('diffnondictionary', 1, 2, [(DIFF_CHANGED, '', 1, 2)]),
+    ]
+    tests4 = [0, 0, 0]
+    for test in TESTS:
+        result = list(dict_diff(test[1], test[2]))
+        expectation = test[3]
+        matched = len(result) == len(expectation) and all(dict_equal(list(r), list(e)) for r, e in zip(result, expectation))
+        print("Test ({0}) Result : {1}".format(test[0], "Pass" if matched else "Failed"))
+        if matched:
+            tests4[0]+=1
+        else:
+            tests4[1]+=1
+        tests4[2]+=1
+        if not matched:
+            print("Expectation : ")
+            pp.pprint(expectation)
+            print("Found : ")
+            pp.pprint(result)
+
     print("dict_filters tests Passed : {0}, Failed : {1}, Total : {2}".format(tests1[0], tests1[1], tests1[2]))
     print("dict project tests Passed : {0}, Failed : {1}, Total : {2}".format(tests2[0], tests2[1], tests2[2]))
+    print("dict flatten tests Passed : {0}, Failed : {1}, Total : {2}".format(tests3[0], tests3[1], tests3[2]))
+    print("dict diff tests Passed : {0}, Failed : {1}, Total : {2}".format(tests4[0], tests4[1], tests4[2]))